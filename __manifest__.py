@@ -1,6 +1,6 @@
 {
     'name': 'SILINA-EDU - Gestion Scolaire',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.2.0',
     'category': 'Education',
     'summary': 'Module complet de gestion d\'un complexe scolaire (Primaire, Collège, Lycée)',
     'description': """
@@ -37,6 +37,9 @@
         # Data
         'data/sequence_data.xml',
         'data/academic_data.xml',
+        'data/job_data.xml',
+        'data/grade_band_data.xml',
+        'data/fee_dunning_data.xml',
 
         # Reports (loaded before views to allow views to reference report actions)
         # Note: report_card_template.xml must be loaded before invoice_report_template.xml
@@ -46,6 +49,7 @@
         'reports/student_list_template.xml',
         'reports/invoice_report_template.xml',
         'reports/invoice_enhanced_template.xml',
+        'reports/fee_dunning_template.xml',
 
         # Views - Separated by model
         # Note: classroom_views and student_views must be loaded before academic_year_views
@@ -62,15 +66,22 @@
         'views/academic_year_views.xml',
         'views/exam_views.xml',
         'views/exam_result_views.xml',
+        'views/grade_band_views.xml',
+        'views/period_average_views.xml',
+        'views/student_fee_ledger_views.xml',
+        'views/fee_dunning_views.xml',
         'views/fee_type_views.xml',
         'views/payroll_views.xml',
         'views/account_payment_views.xml',
+        'views/job_views.xml',
 
         # Wizards (must be loaded before menus that reference them)
         'wizards/bulk_student_promotion_views.xml',
         'wizards/generate_report_card_views.xml',
         'wizards/generate_fee_invoices_views.xml',
         'wizards/student_fee_payment_views.xml',
+        'wizards/student_import_views.xml',
+        'wizards/fee_batch_payment_views.xml',
 
         # Menus (loaded after wizards)
         'views/menu_views.xml',
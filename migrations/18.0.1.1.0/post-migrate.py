@@ -0,0 +1,33 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Renseigner les liens élève / type de frais / année des factures de frais existantes
+
+    Les factures créées avant l'ajout de ces champs étaient retrouvées par
+    leur contact (celui de l'élève) et l'article du type de frais.
+    """
+    cr.execute("""
+        UPDATE account_move move
+           SET silina_student_id = link.student_id,
+               silina_fee_type_id = link.fee_type_id,
+               silina_academic_year_id = link.academic_year_id
+          FROM (
+                SELECT DISTINCT ON (line.move_id)
+                       line.move_id,
+                       student.id AS student_id,
+                       fee_type.id AS fee_type_id,
+                       student.academic_year_id
+                  FROM account_move_line line
+                  JOIN account_move invoice ON invoice.id = line.move_id
+                  JOIN silina_student student ON student.partner_id = invoice.partner_id
+                  JOIN silina_fee_type fee_type ON fee_type.product_id = line.product_id
+                 WHERE invoice.move_type = 'out_invoice'
+                   AND invoice.silina_student_id IS NULL
+              ORDER BY line.move_id, line.id
+               ) link
+         WHERE move.id = link.move_id
+    """)
+    _logger.info("silina_edu: %s factures de frais reliées à leur élève", cr.rowcount)
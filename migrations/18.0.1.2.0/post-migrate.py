@@ -0,0 +1,31 @@
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Relier les lignes de factures existantes à leur tranche et construire les soldes des élèves
+
+    La première ligne du libellé des lignes de factures de frais est
+    « <type de frais> - <tranche> » (voir les assistants de facturation).
+    """
+    cr.execute("""
+        UPDATE account_move_line line
+           SET silina_installment_id = installment.id
+          FROM account_move move, silina_fee_type fee_type, silina_fee_type_installment installment
+         WHERE line.move_id = move.id
+           AND line.display_type = 'product'
+           AND line.silina_installment_id IS NULL
+           AND move.silina_fee_type_id = fee_type.id
+           AND installment.fee_type_id = fee_type.id
+           AND split_part(line.name, E'\n', 1) = fee_type.name || ' - ' || installment.name
+    """)
+    _logger.info("silina_edu: %s lignes de factures reliées à leur tranche", cr.rowcount)
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("SELECT DISTINCT silina_student_id FROM account_move WHERE silina_student_id IS NOT NULL")
+    student_ids = [row[0] for row in cr.fetchall()]
+    academic_year_ids = env['silina.student.fee.ledger']._refresh_students(student_ids)
+    env['silina.financial.snapshot'].search([('academic_year_id', 'in', list(academic_year_ids))])._refresh()
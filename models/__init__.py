@@ -6,10 +6,19 @@ from . import teacher
 from . import student
 from . import parent
 from . import student_document
+from . import grade_band
 from . import exam
 from . import exam_result
+from . import period_average
+from . import exam_statistics
 from . import subject_assignment
 from . import fee_type
 from . import payroll
 from . import res_partner
+from . import account_move
+from . import account_payment
 from . import dashboard
+from . import job
+from . import financial_snapshot
+from . import student_fee_ledger
+from . import fee_dunning
@@ -0,0 +1,89 @@
+from odoo import models, fields, api, _
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    # Liens des factures de frais scolaires (clés de recherche indexées)
+    silina_student_id = fields.Many2one(
+        'silina.student',
+        string='Élève',
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        ondelete='set null',
+        help="Élève concerné par cette facture de frais scolaires"
+    )
+    silina_fee_type_id = fields.Many2one(
+        'silina.fee.type',
+        string='Type de frais',
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        ondelete='set null'
+    )
+    silina_academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année scolaire',
+        index='btree_not_null',
+        copy=False,
+        readonly=True,
+        ondelete='set null'
+    )
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        posted._silina_mark_financial_dirty()
+        return posted
+
+    def button_cancel(self):
+        res = super().button_cancel()
+        self._silina_mark_financial_dirty()
+        return res
+
+    def button_draft(self):
+        res = super().button_draft()
+        self._silina_mark_financial_dirty()
+        return res
+
+    def _silina_mark_financial_dirty(self):
+        """Signaler aux soldes des élèves les factures de frais modifiées
+
+        La synthèse financière des années concernées est recalculée à la
+        suite des soldes (voir ``student_fee_ledger.py``).
+        """
+        invoices = self.filtered(lambda m: m.move_type == 'out_invoice' and m.silina_student_id)
+        if invoices:
+            self.env['silina.student.fee.ledger']._mark_dirty(invoices.silina_student_id.ids)
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+
+    silina_installment_id = fields.Many2one(
+        'silina.fee.type.installment',
+        string='Tranche',
+        index='btree_not_null',
+        copy=False,
+        ondelete='set null',
+        help="Tranche de frais scolaires facturée par cette ligne"
+    )
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partials = super().create(vals_list)
+        partials._silina_reconciled_moves()._silina_mark_financial_dirty()
+        return partials
+
+    def unlink(self):
+        moves = self._silina_reconciled_moves()
+        res = super().unlink()
+        moves.exists()._silina_mark_financial_dirty()
+        return res
+
+    def _silina_reconciled_moves(self):
+        return (self.debit_move_id | self.credit_move_id).move_id
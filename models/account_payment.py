@@ -0,0 +1,20 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+
+class AccountPayment(models.Model):
+    _inherit = 'account.payment'
+
+    @api.model
+    def action_print_today_receipts(self):
+        """Imprimer en un seul lot les reçus de tous les paiements clients validés du jour"""
+        payments = self.search([
+            ('date', '=', fields.Date.context_today(self)),
+            ('payment_type', '=', 'inbound'),
+            ('partner_type', '=', 'customer'),
+            ('move_id.state', '=', 'posted'),
+            ('company_id', '=', self.env.company.id),
+        ], order='name')
+        if not payments:
+            raise UserError(_('Aucun paiement validé aujourd\'hui.'))
+        return self.env.ref('silina_edu.action_report_payment_receipt').report_action(payments)
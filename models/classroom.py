@@ -60,6 +60,12 @@ class Classroom(models.Model):
         compute='_compute_student_count',
         store=True
     )
+    capacity = fields.Integer(
+        string='Capacité',
+        default=0,
+        help="Nombre maximal d'élèves (0 = illimité). Utilisé pour répartir "
+             "les élèves entre les sections lors du passage en masse"
+    )
 
     # Matières et enseignants
     subject_assignment_ids = fields.One2many(
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
 
 
@@ -6,6 +8,17 @@ class Dashboard(models.Model):
     _description = 'Tableau de Bord Scolaire'
     _rec_name = 'current_academic_year_id'
 
+    # Champ compteur associé à chaque état d'élève
+    _STUDENT_STATE_FIELDS = {
+        'draft': 'draft_students',
+        'enrolled': 'enrolled_students',
+        'promoted': 'promoted_students',
+        'repeated': 'repeated_students',
+        'transferred': 'transferred_students',
+        'graduated': 'graduated_students',
+        'expelled': 'expelled_students',
+    }
+
     # Statistiques générales des élèves
     total_students = fields.Integer(
         string='Total Élèves',
@@ -21,10 +34,34 @@ class Dashboard(models.Model):
     )
 
     # Statistiques par état
+    draft_students = fields.Integer(
+        string='Élèves en Brouillon',
+        compute='_compute_student_stats'
+    )
     enrolled_students = fields.Integer(
         string='Élèves Inscrits',
         compute='_compute_student_stats'
     )
+    promoted_students = fields.Integer(
+        string='Élèves Admis',
+        compute='_compute_student_stats'
+    )
+    repeated_students = fields.Integer(
+        string='Élèves Redoublants',
+        compute='_compute_student_stats'
+    )
+    transferred_students = fields.Integer(
+        string='Élèves Transférés',
+        compute='_compute_student_stats'
+    )
+    graduated_students = fields.Integer(
+        string='Élèves Diplômés',
+        compute='_compute_student_stats'
+    )
+    expelled_students = fields.Integer(
+        string='Élèves Exclus',
+        compute='_compute_student_stats'
+    )
 
     # Statistiques financières
     total_students_with_debt = fields.Integer(
@@ -102,67 +139,58 @@ class Dashboard(models.Model):
 
     @api.depends('current_academic_year_id')
     def _compute_student_stats(self):
-        """Calcul des statistiques générales des élèves"""
+        """Calcul des statistiques générales des élèves
+
+        Une seule requête groupée par sexe et par état alimente tous les compteurs.
+        """
         for record in self:
             domain = [('active', '=', True)]
             if record.current_academic_year_id:
                 domain.append(('academic_year_id', '=', record.current_academic_year_id.id))
 
-            Student = self.env['silina.student']
+            groups = self.env['silina.student']._read_group(domain, ['gender', 'state'], ['__count'])
+
+            by_gender = dict.fromkeys(['male', 'female'], 0)
+            by_state = dict.fromkeys(self._STUDENT_STATE_FIELDS, 0)
+            for gender, state, count in groups:
+                by_gender[gender] = by_gender.get(gender, 0) + count
+                by_state[state] = by_state.get(state, 0) + count
 
             # Total des élèves
-            record.total_students = Student.search_count(domain)
+            record.total_students = sum(by_state.values())
 
             # Par sexe
-            record.male_students = Student.search_count(domain + [('gender', '=', 'male')])
-            record.female_students = Student.search_count(domain + [('gender', '=', 'female')])
+            record.male_students = by_gender['male']
+            record.female_students = by_gender['female']
 
-            # Élèves inscrits (état = enrolled)
-            record.enrolled_students = Student.search_count(domain + [('state', '=', 'enrolled')])
+            # Par état
+            for state, field_name in self._STUDENT_STATE_FIELDS.items():
+                record[field_name] = by_state[state]
 
     @api.depends('current_academic_year_id')
     def _compute_financial_stats(self):
-        """Calcul des statistiques financières"""
+        """Calcul des statistiques financières à partir de la synthèse matérialisée"""
+        Snapshot = self.env['silina.financial.snapshot']
         for record in self:
-            domain = [
-                ('move_type', '=', 'out_invoice'),
-                ('state', '!=', 'cancel')
-            ]
-
             if record.current_academic_year_id:
-                # Filtrer par année scolaire si disponible
-                domain.append(('invoice_date', '>=', record.current_academic_year_id.date_start))
-                domain.append(('invoice_date', '<=', record.current_academic_year_id.date_end))
-
-            Invoice = self.env['account.move']
-            invoices = Invoice.search(domain)
-
-            # Calculer les montants
-            total_expected = sum(invoices.mapped('amount_total'))
-            total_paid = sum(invoices.mapped('amount_total')) - sum(invoices.mapped('amount_residual'))
-            total_debt = sum(invoices.mapped('amount_residual'))
-
-            record.total_expected_amount = total_expected
-            record.total_paid_amount = total_paid
-            record.total_debt_amount = total_debt
-
-            # Calculer le taux de paiement
-            if total_expected > 0:
-                record.payment_rate = (total_paid / total_expected) * 100
+                # Lecture d'une seule ligne, maintenue à jour à chaque validation/lettrage
+                snapshot = Snapshot._get_for_year(record.current_academic_year_id)
+                values = {
+                    'expected_amount': snapshot.expected_amount,
+                    'paid_amount': snapshot.paid_amount,
+                    'debt_amount': snapshot.debt_amount,
+                    'payment_rate': snapshot.payment_rate,
+                    'debtor_count': snapshot.debtor_count,
+                }
             else:
-                record.payment_rate = 0.0
-
-            # Compter les élèves avec dettes (factures impayées)
-            invoices_with_debt = invoices.filtered(lambda inv: inv.amount_residual > 0)
-            partner_ids_with_debt = invoices_with_debt.mapped('partner_id.id')
-
-            # Trouver les élèves correspondant à ces partenaires
-            students_with_debt = self.env['silina.student'].search([
-                ('partner_id', 'in', partner_ids_with_debt),
-                ('active', '=', True)
-            ])
+                # Sans année scolaire, agréger tous les soldes des élèves à la volée
+                values = Snapshot._compute_values()
 
-            record.total_students_with_debt = len(students_with_debt)
+            record.total_expected_amount = values['expected_amount']
+            record.total_paid_amount = values['paid_amount']
+            record.total_debt_amount = values['debt_amount']
+            record.payment_rate = values['payment_rate']
+            record.total_students_with_debt = values['debtor_count']
 
     def _compute_cash_stats(self):
         """Calcul des statistiques de caisse"""
@@ -187,65 +215,69 @@ class Dashboard(models.Model):
                 record.cash_balance = 0.0
 
     def _generate_level_stats(self):
-        """Génère les statistiques par niveau"""
+        """Génère les statistiques par niveau (une requête groupée niveau × sexe)"""
         self.ensure_one()
-        # Supprimer les anciennes statistiques
-        self.stats_by_level_ids.unlink()
-
-        domain = [('active', '=', True)]
+        domain = [('active', '=', True), ('level_id', '!=', False)]
         if self.current_academic_year_id:
             domain.append(('academic_year_id', '=', self.current_academic_year_id.id))
 
-        # Récupérer tous les niveaux
-        levels = self.env['silina.level'].search([])
-
-        for level in levels:
-            students = self.env['silina.student'].search(
-                domain + [('level_id', '=', level.id)]
-            )
-
-            if students:
-                male_count = len(students.filtered(lambda s: s.gender == 'male'))
-                female_count = len(students.filtered(lambda s: s.gender == 'female'))
-
-                self.env['silina.dashboard.level.stats'].create({
-                    'dashboard_id': self.id,
-                    'level_id': level.id,
-                    'total_students': len(students),
-                    'male_students': male_count,
-                    'female_students': female_count,
-                })
+        counts = self._count_students_by(domain, 'level_id')
+        self._upsert_stats(self.stats_by_level_ids, 'level_id', counts)
 
     def _generate_classroom_stats(self):
-        """Génère les statistiques par classe"""
+        """Génère les statistiques par classe (une requête groupée classe × sexe)"""
         self.ensure_one()
-        # Supprimer les anciennes statistiques
-        self.stats_by_classroom_ids.unlink()
-
-        domain = []
+        domain = [('active', '=', True), ('classroom_id', '!=', False)]
         if self.current_academic_year_id:
-            domain.append(('academic_year_id', '=', self.current_academic_year_id.id))
-
-        # Récupérer toutes les classes
-        classrooms = self.env['silina.classroom'].search(domain)
-
-        for classroom in classrooms:
-            students = self.env['silina.student'].search([
-                ('classroom_id', '=', classroom.id),
-                ('active', '=', True)
-            ])
-
-            if students:
-                male_count = len(students.filtered(lambda s: s.gender == 'male'))
-                female_count = len(students.filtered(lambda s: s.gender == 'female'))
-
-                self.env['silina.dashboard.classroom.stats'].create({
-                    'dashboard_id': self.id,
-                    'classroom_id': classroom.id,
-                    'total_students': len(students),
-                    'male_students': male_count,
-                    'female_students': female_count,
-                })
+            domain.append(('classroom_id.academic_year_id', '=', self.current_academic_year_id.id))
+
+        counts = self._count_students_by(domain, 'classroom_id')
+        self._upsert_stats(self.stats_by_classroom_ids, 'classroom_id', counts)
+
+    def _count_students_by(self, domain, group_field):
+        """Compter les élèves par valeur de ``group_field`` et par sexe
+
+        :return: dict {id: {'total_students': n, 'male_students': n, 'female_students': n}}
+        """
+        groups = self.env['silina.student']._read_group(domain, [group_field, 'gender'], ['__count'])
+        counts = {}
+        for group, gender, count in groups:
+            values = counts.setdefault(group.id, {
+                'total_students': 0,
+                'male_students': 0,
+                'female_students': 0,
+            })
+            values['total_students'] += count
+            if gender == 'male':
+                values['male_students'] += count
+            elif gender == 'female':
+                values['female_students'] += count
+        return counts
+
+    def _upsert_stats(self, stats, key_field, counts):
+        """Mettre à jour les lignes de statistiques existantes au lieu de les recréer
+
+        Les lignes modifiées sont mises à jour par valeurs identiques (une
+        écriture par combinaison de compteurs), les nouveaux groupes créés en
+        une fois et les groupes disparus supprimés.
+        """
+        existing = {line[key_field].id: line for line in stats}
+
+        to_create = []
+        to_write = defaultdict(list)
+        for key, values in counts.items():
+            line = existing.pop(key, None)
+            if line is None:
+                to_create.append(dict(values, dashboard_id=self.id, **{key_field: key}))
+            elif any(line[name] != value for name, value in values.items()):
+                to_write[tuple(sorted(values.items()))].append(line.id)
+
+        for values, line_ids in to_write.items():
+            stats.browse(line_ids).write(dict(values))
+        if to_create:
+            stats.create(to_create)
+        if existing:
+            stats.browse([line.id for line in existing.values()]).unlink()
 
     def _compute_staff_stats(self):
         """Calcul des statistiques du personnel"""
@@ -279,6 +311,10 @@ class Dashboard(models.Model):
     def action_refresh(self):
         """Rafraîchir les statistiques"""
         self.ensure_one()
+        # Recalculer la synthèse financière (rattrape les changements hors factures, ex: élèves archivés)
+        if self.current_academic_year_id:
+            self.env['silina.financial.snapshot']._get_for_year(self.current_academic_year_id)._refresh()
+
         # Forcer le recalcul de tous les champs computed
         self._compute_student_stats()
         self._compute_financial_stats()
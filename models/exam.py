@@ -1,3 +1,6 @@
+import csv
+import io
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
@@ -80,6 +83,12 @@ class Exam(models.Model):
         'exam_id',
         string='Résultats'
     )
+    statistics_ids = fields.One2many(
+        'silina.exam.statistics',
+        'exam_id',
+        string='Statistiques de classe',
+        readonly=True
+    )
     result_count = fields.Integer(
         string='Nombre de résultats',
         compute='_compute_result_count'
@@ -97,6 +106,21 @@ class Exam(models.Model):
         help="Note minimale pour réussir"
     )
 
+    rank_method = fields.Selection([
+        ('standard', 'Standard (1, 2, 2, 4)'),
+        ('dense', 'Dense (1, 2, 2, 3)'),
+    ], string='Classement des ex æquo', default='standard', required=True,
+        help="Standard: les ex æquo partagent un rang et le rang suivant est sauté. "
+             "Dense: les ex æquo partagent un rang sans saut.")
+
+    bulk_entry_audit = fields.Boolean(
+        string='Saisie en masse sans suivi',
+        default=False,
+        help="Lors de la saisie en masse des notes, ne pas historiser chaque champ de chaque résultat : "
+             "un seul message d'audit par lot est publié sur l'examen, avec le détail des "
+             "modifications en pièce jointe (CSV)."
+    )
+
     state = fields.Selection([
         ('draft', 'Brouillon'),
         ('scheduled', 'Programmé'),
@@ -129,6 +153,17 @@ class Exam(models.Model):
         for record in self:
             record.result_count = len(record.result_ids)
 
+    def write(self, vals):
+        res = super().write(vals)
+        if 'total_marks' in vals or 'passing_marks' in vals:
+            # Le barème modifie pourcentage, mention et admission de tous les résultats
+            self.env['silina.exam.result']._bulk_recompute(exam_ids=self.ids)
+        return res
+
+    def action_refresh_statistics(self):
+        self.env['silina.exam.statistics']._refresh_exams(self.ids)
+        return True
+
     def action_schedule(self):
         self.ensure_one()
         self.state = 'scheduled'
@@ -166,3 +201,191 @@ class Exam(models.Model):
                 'default_total_marks': self.total_marks,
             }
         }
+
+    # ------------------------------------------------------------------
+    # Grille de saisie des notes (classe × matière)
+    # ------------------------------------------------------------------
+
+    def _get_grid_subjects(self, classroom):
+        """Matières de la grille : celles de l'examen, sinon celles affectées à la classe"""
+        self.ensure_one()
+        return self.subject_ids or classroom.subject_assignment_ids.subject_id
+
+    def get_grade_grid(self, classroom_id):
+        """Retourner la grille des notes d'une classe pour cet examen
+
+        Les élèves, les matières et toutes les notes existantes sont lus en
+        trois requêtes.
+
+        :return: dict {'students': [...], 'subjects': [...], 'marks': {"student_id,subject_id": {...}}}
+        """
+        self.ensure_one()
+        classroom = self.env['silina.classroom'].browse(classroom_id)
+        students = self.env['silina.student'].search([('classroom_id', '=', classroom.id)])
+        subjects = self._get_grid_subjects(classroom)
+
+        marks = {}
+        for result in self.env['silina.exam.result'].search_read([
+            ('exam_id', '=', self.id),
+            ('student_id', 'in', students.ids),
+            ('subject_id', 'in', subjects.ids),
+        ], ['student_id', 'subject_id', 'marks_obtained', 'remarks', 'state'], load=None):
+            marks[f"{result['student_id']},{result['subject_id']}"] = {
+                'id': result['id'],
+                'marks_obtained': result['marks_obtained'],
+                'remarks': result['remarks'] or '',
+                'state': result['state'],
+            }
+
+        return {
+            'exam': {'id': self.id, 'name': self.name, 'total_marks': self.total_marks},
+            'classroom': {'id': classroom.id, 'name': classroom.name},
+            'students': [{'id': s.id, 'name': s.name, 'registration_number': s.registration_number}
+                         for s in students],
+            'subjects': [{'id': s.id, 'name': s.name, 'coefficient': s.coefficient} for s in subjects],
+            'marks': marks,
+        }
+
+    def save_grade_grid(self, classroom_id, entries):
+        """Enregistrer en une transaction une matrice de notes (création ou mise à jour)
+
+        Les résultats existants sont chargés en une requête ; les nouvelles
+        notes sont créées en un seul ``create(vals_list)`` et les notes
+        modifiées sont écrites par valeur identique, de sorte que pourcentage,
+        mention, admission et note pondérée sont recalculés en un seul lot.
+        Les saisies concurrentes d'un même examen sont sérialisées pour
+        respecter la contrainte ``result_unique``.
+
+        :param entries: liste de dict {'student_id', 'subject_id', 'marks_obtained', 'remarks' (optionnel)} ;
+                        une note vide (None) est ignorée
+        :return: dict {'created': n, 'updated': n, 'unchanged': n}
+        """
+        self.ensure_one()
+        classroom = self.env['silina.classroom'].browse(classroom_id)
+        student_ids = set(self.env['silina.student'].search([('classroom_id', '=', classroom.id)]).ids)
+        subject_ids = set(self._get_grid_subjects(classroom).ids)
+
+        # Dernière saisie de chaque cellule
+        cells = {}
+        for entry in entries:
+            if entry.get('marks_obtained') is None:
+                continue
+            key = (int(entry['student_id']), int(entry['subject_id']))
+            if key[0] not in student_ids:
+                raise ValidationError(_("L'élève %(student)s n'appartient pas à la classe %(classroom)s!") % {
+                    'student': key[0], 'classroom': classroom.name,
+                })
+            if key[1] not in subject_ids:
+                raise ValidationError(_("La matière %s ne fait pas partie de cet examen!") % key[1])
+            cells[key] = entry
+        if not cells:
+            return {'created': 0, 'updated': 0, 'unchanged': 0}
+
+        # Sérialiser les saisies concurrentes du même examen
+        self.env.cr.execute("SELECT id FROM silina_exam WHERE id = %s FOR NO KEY UPDATE", [self.id])
+
+        Result = self.env['silina.exam.result']
+        if self.bulk_entry_audit:
+            Result = Result.with_context(tracking_disable=True, mail_create_nolog=True, mail_notrack=True)
+        existing = {
+            (result['student_id'], result['subject_id']): result
+            for result in Result.search_read([
+                ('exam_id', '=', self.id),
+                ('student_id', 'in', list({key[0] for key in cells})),
+                ('subject_id', 'in', list({key[1] for key in cells})),
+            ], ['student_id', 'subject_id', 'marks_obtained', 'remarks'], load=None)
+        }
+
+        to_create = []
+        to_write = {}
+        unchanged = 0
+        for (student_id, subject_id), entry in cells.items():
+            vals = {'marks_obtained': float(entry['marks_obtained'])}
+            if 'remarks' in entry:
+                vals['remarks'] = entry['remarks'] or False
+            result = existing.get((student_id, subject_id))
+            if not result:
+                to_create.append(dict(vals, exam_id=self.id, student_id=student_id, subject_id=subject_id))
+                continue
+            vals = {
+                field: value for field, value in vals.items()
+                if (result[field] or False) != value
+            }
+            if not vals:
+                unchanged += 1
+                continue
+            to_write.setdefault(tuple(sorted(vals.items())), []).append(result['id'])
+
+        if to_create:
+            Result.create(to_create)
+        for vals, result_ids in to_write.items():
+            Result.browse(result_ids).write(dict(vals))
+        updated = Result.browse([rid for ids in to_write.values() for rid in ids])
+        updated.filtered(lambda r: r.state == 'confirmed')._update_summaries()
+
+        if self.bulk_entry_audit and (to_create or to_write):
+            updated_ids = set(updated.ids)
+            changed_keys = {
+                (vals['student_id'], vals['subject_id']) for vals in to_create
+            } | {
+                key for key, result in existing.items()
+                if result['id'] in updated_ids
+            }
+            self._post_bulk_entry_audit(classroom, {
+                key: (existing.get(key), cells[key]) for key in changed_keys
+            }, created=len(to_create), updated=len(updated))
+
+        return {
+            'created': len(to_create),
+            'updated': len(updated),
+            'unchanged': unchanged,
+        }
+
+    def _post_bulk_entry_audit(self, classroom, changes, created, updated):
+        """Publier un seul message d'audit pour un lot de notes saisies sans suivi
+
+        :param changes: dict {(student_id, subject_id): (ancien résultat ou None, saisie)}
+        """
+        self.ensure_one()
+        students = self.env['silina.student'].browse({key[0] for key in changes})
+        subjects = self.env['silina.subject'].browse({key[1] for key in changes})
+        student_info = {s.id: (s.registration_number, s.name) for s in students}
+        subject_names = {s.id: s.name for s in subjects}
+
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=';')
+        writer.writerow([
+            _('Matricule'), _('Élève'), _('Matière'),
+            _('Ancienne note'), _('Nouvelle note'),
+            _('Ancienne observation'), _('Nouvelle observation'),
+        ])
+        for (student_id, subject_id), (old, entry) in sorted(
+                changes.items(), key=lambda item: (student_info[item[0][0]][1] or '', subject_names[item[0][1]] or '')):
+            old_remarks = (old['remarks'] or '') if old else ''
+            new_remarks = (entry['remarks'] or '') if 'remarks' in entry else old_remarks
+            writer.writerow([
+                student_info[student_id][0],
+                student_info[student_id][1],
+                subject_names[subject_id],
+                old['marks_obtained'] if old else '',
+                entry['marks_obtained'],
+                old_remarks,
+                new_remarks,
+            ])
+
+        filename = 'notes-%s-%s-%s.csv' % (
+            self.code, classroom.code or classroom.id, fields.Datetime.now().strftime('%Y%m%d%H%M%S'),
+        )
+        body = _('%(user)s a saisi %(count)s notes en %(classroom)s (%(created)s créées, %(updated)s modifiées).') % {
+            'user': self.env.user.name,
+            'count': created + updated,
+            'classroom': classroom.name,
+            'created': created,
+            'updated': updated,
+        }
+        # Les enseignants n'ont qu'un accès en lecture aux examens
+        self.sudo().message_post(
+            body=body,
+            author_id=self.env.user.partner_id.id,
+            attachments=[(filename, output.getvalue().encode('utf-8-sig'))],
+        )
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
@@ -113,6 +115,65 @@ class ExamResult(models.Model):
          'Un résultat existe déjà pour cet examen, élève et matière!'),
     ]
 
+    # Champs dont dépend la contribution d'un résultat aux totaux de son résumé
+    _SUMMARY_TRIGGER_FIELDS = ('state', 'marks_obtained', 'exam_id', 'student_id', 'subject_id')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        results = super().create(vals_list)
+        self.env['silina.exam.result.summary']._apply_total_deltas(results._get_summary_contributions())
+        self.env['silina.exam.statistics']._mark_dirty(results._get_statistics_keys())
+        results.student_id._invalidate_report_card_cache()
+        return results
+
+    def write(self, vals):
+        track = any(field in vals for field in self._SUMMARY_TRIGGER_FIELDS)
+        before = self._get_summary_contributions() if track else {}
+        statistics_keys = self._get_statistics_keys() if track else set()
+        res = super().write(vals)
+        if track:
+            self.env['silina.exam.statistics']._mark_dirty(statistics_keys | self._get_statistics_keys())
+            deltas = defaultdict(lambda: [0.0] * 4)
+            for key, values in self._get_summary_contributions().items():
+                deltas[key] = [d + v for d, v in zip(deltas[key], values)]
+            for key, values in before.items():
+                deltas[key] = [d - v for d, v in zip(deltas[key], values)]
+            self.env['silina.exam.result.summary']._apply_total_deltas(deltas)
+        self.student_id._invalidate_report_card_cache()
+        return res
+
+    def unlink(self):
+        students = self.student_id
+        contributions = self._get_summary_contributions()
+        self.env['silina.exam.statistics']._mark_dirty(self._get_statistics_keys())
+        res = super().unlink()
+        self.env['silina.exam.result.summary']._apply_total_deltas({
+            key: [-value for value in values] for key, values in contributions.items()
+        })
+        students._invalidate_report_card_cache()
+        return res
+
+    def _get_summary_contributions(self):
+        """Contribution des résultats confirmés aux totaux de leurs résumés
+
+        :return: dict {(exam_id, student_id): [notes, notes possibles, notes pondérées, coefficients]}
+        """
+        contributions = defaultdict(lambda: [0.0] * 4)
+        for result in self.filtered(lambda r: r.state == 'confirmed'):
+            values = contributions[(result.exam_id.id, result.student_id.id)]
+            values[0] += result.marks_obtained
+            values[1] += result.total_marks
+            values[2] += result.weighted_marks
+            values[3] += result.coefficient
+        return contributions
+
+    def _get_statistics_keys(self):
+        """Clés (examen, classe, matière) des statistiques de classe des résultats confirmés"""
+        return {
+            (result.exam_id.id, result.classroom_id.id, result.subject_id.id)
+            for result in self if result.state == 'confirmed'
+        }
+
     @api.constrains('marks_obtained', 'total_marks')
     def _check_marks(self):
         for record in self:
@@ -131,20 +192,10 @@ class ExamResult(models.Model):
 
     @api.depends('percentage')
     def _compute_grade(self):
+        GradeBand = self.env['silina.grade.band']
+        bands = GradeBand._get_bands()
         for record in self:
-            percentage = record.percentage
-            if percentage >= 90:
-                record.grade = 'Excellent'
-            elif percentage >= 80:
-                record.grade = 'Très Bien'
-            elif percentage >= 70:
-                record.grade = 'Bien'
-            elif percentage >= 60:
-                record.grade = 'Assez Bien'
-            elif percentage >= 50:
-                record.grade = 'Passable'
-            else:
-                record.grade = 'Insuffisant'
+            record.grade = GradeBand._get_grade(record.percentage, bands)
 
     @api.depends('marks_obtained', 'passing_marks')
     def _compute_is_passed(self):
@@ -156,16 +207,108 @@ class ExamResult(models.Model):
         for record in self:
             record.weighted_marks = record.marks_obtained * record.coefficient
 
+    @api.model
+    def _bulk_recompute(self, exam_ids=None, subject_ids=None):
+        """Recalculer en une requête UPDATE les champs calculés des résultats
+
+        Note maximale, note de passage, coefficient, pourcentage, mention
+        (d'après les mentions de ``silina.grade.band``), admission et note
+        pondérée sont recalculés pour tous les résultats des examens et/ou
+        matières donnés, sans passer par les méthodes de calcul ligne à
+        ligne. Les totaux des résumés et les statistiques de classe
+        concernés sont ensuite mis à jour.
+        """
+        where, params = [], {}
+        if exam_ids is not None:
+            where.append("result.exam_id = ANY(%(exam_ids)s)")
+            params['exam_ids'] = list(exam_ids)
+        if subject_ids is not None:
+            where.append("result.subject_id = ANY(%(subject_ids)s)")
+            params['subject_ids'] = list(subject_ids)
+        if not where or not all(params.values()):
+            return
+
+        computed = ['total_marks', 'passing_marks', 'coefficient', 'percentage', 'grade', 'is_passed', 'weighted_marks']
+        self.flush_model(['exam_id', 'subject_id', 'marks_obtained', 'state'])
+        self.env['silina.exam'].flush_model(['total_marks', 'passing_marks'])
+        self.env['silina.subject'].flush_model(['coefficient'])
+        self.env['silina.grade.band'].flush_model()
+
+        params['uid'] = self.env.uid
+        self.env.cr.execute(f"""
+            UPDATE silina_exam_result target
+               SET total_marks = source.total_marks,
+                   passing_marks = source.passing_marks,
+                   coefficient = source.coefficient,
+                   percentage = source.percentage,
+                   grade = (SELECT band.name
+                              FROM silina_grade_band band
+                             WHERE band.active AND band.min_percentage <= source.percentage
+                          ORDER BY band.min_percentage DESC
+                             LIMIT 1),
+                   is_passed = source.marks_obtained >= COALESCE(source.passing_marks, 0),
+                   weighted_marks = source.marks_obtained * COALESCE(source.coefficient, 0),
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (
+                    SELECT result.id,
+                           COALESCE(result.marks_obtained, 0) AS marks_obtained,
+                           exam.total_marks,
+                           exam.passing_marks,
+                           subject.coefficient,
+                           CASE WHEN exam.total_marks > 0
+                                THEN COALESCE(result.marks_obtained, 0) / exam.total_marks * 100
+                                ELSE 0
+                           END AS percentage
+                      FROM silina_exam_result result
+                      JOIN silina_exam exam ON exam.id = result.exam_id
+                      JOIN silina_subject subject ON subject.id = result.subject_id
+                     WHERE {' AND '.join(where)}
+                   ) source
+             WHERE target.id = source.id
+         RETURNING target.id
+        """, params)
+        results = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not results:
+            return
+
+        # Les valeurs sont à jour en base : annuler les recalculs ORM en attente
+        for fname in computed:
+            self.env.remove_to_compute(self._fields[fname], results)
+        results.invalidate_recordset(computed + ['write_uid', 'write_date'])
+
+        self.env['silina.exam.result.summary']._recompute_totals_for_results([('id', 'in', results.ids)])
+        self.env['silina.exam.statistics']._mark_dirty(results._get_statistics_keys())
+        results.student_id._invalidate_report_card_cache()
+
     def action_confirm(self):
         self.ensure_one()
         self.state = 'confirmed'
+        self._update_summaries()
         return True
 
     def action_draft(self):
         self.ensure_one()
         self.state = 'draft'
+        self._update_summaries()
         return True
 
+    def _update_summaries(self):
+        """Mettre à jour les résumés concernés et recalculer les rangs des classes touchées
+
+        Les totaux des résumés sont déjà ajustés par ``write`` ; seuls les
+        rangs des examens et classes concernés sont recalculés.
+        """
+        Summary = self.env['silina.exam.result.summary']
+        pairs = {(result.exam_id.id, result.student_id.id) for result in self}
+        summaries = Summary.search([
+            ('exam_id', 'in', self.exam_id.ids),
+            ('student_id', 'in', self.student_id.ids),
+        ]).filtered(lambda s: (s.exam_id.id, s.student_id.id) in pairs)
+        if not summaries:
+            return
+        Summary._compute_ranks(summaries.exam_id.ids, summaries.classroom_id.ids)
+
     @api.depends('student_id', 'exam_id', 'subject_id')
     def name_get(self):
         result = []
@@ -210,26 +353,22 @@ class ExamResultSummary(models.Model):
         readonly=True
     )
 
-    # Calculs
+    # Totaux des résultats confirmés, tenus à jour par ExamResult (create, write, unlink)
     total_marks_obtained = fields.Float(
         string='Total des notes',
-        compute='_compute_totals',
-        store=True
+        readonly=True
     )
     total_marks_possible = fields.Float(
         string='Total possible',
-        compute='_compute_totals',
-        store=True
+        readonly=True
     )
     total_weighted_marks = fields.Float(
         string='Total pondéré',
-        compute='_compute_totals',
-        store=True
+        readonly=True
     )
     total_coefficients = fields.Float(
         string='Total des coefficients',
-        compute='_compute_totals',
-        store=True
+        readonly=True
     )
 
     average = fields.Float(
@@ -269,6 +408,28 @@ class ExamResultSummary(models.Model):
          'Un résumé existe déjà pour cet examen et élève!'),
     ]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Totaux initiaux des nouveaux résumés, en une requête pour tout le lot
+        totals = self._get_confirmed_totals(
+            {vals.get('exam_id') for vals in vals_list},
+            {vals.get('student_id') for vals in vals_list},
+        )
+        for vals in vals_list:
+            vals.update(totals.get((vals.get('exam_id'), vals.get('student_id')), {}))
+        return super().create(vals_list)
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.student_id._invalidate_report_card_cache()
+        return res
+
+    def unlink(self):
+        students = self.student_id
+        res = super().unlink()
+        students._invalidate_report_card_cache()
+        return res
+
     def _compute_result_ids(self):
         for record in self:
             record.result_ids = self.env['silina.exam.result'].search([
@@ -276,18 +437,90 @@ class ExamResultSummary(models.Model):
                 ('student_id', '=', record.student_id.id)
             ])
 
-    @api.depends('result_ids', 'result_ids.marks_obtained', 'result_ids.weighted_marks')
-    def _compute_totals(self):
+    @api.model
+    def _get_confirmed_totals(self, exam_ids, student_ids):
+        """Totaux des résultats confirmés, en une requête groupée
+
+        :return: dict {(exam_id, student_id): dict des totaux}
+        """
+        exam_ids = [exam_id for exam_id in exam_ids if exam_id]
+        student_ids = [student_id for student_id in student_ids if student_id]
+        if not exam_ids or not student_ids:
+            return {}
+        self.env['silina.exam.result'].flush_model(
+            ['state', 'marks_obtained', 'total_marks', 'weighted_marks', 'coefficient'])
+        return {
+            (exam.id, student.id): {
+                'total_marks_obtained': marks,
+                'total_marks_possible': possible,
+                'total_weighted_marks': weighted,
+                'total_coefficients': coefficients,
+            }
+            for exam, student, marks, possible, weighted, coefficients in self.env['silina.exam.result']._read_group([
+                ('exam_id', 'in', exam_ids),
+                ('student_id', 'in', student_ids),
+                ('state', '=', 'confirmed'),
+            ], ['exam_id', 'student_id'],
+                ['marks_obtained:sum', 'total_marks:sum', 'weighted_marks:sum', 'coefficient:sum'])
+        }
+
+    @api.model
+    def _apply_total_deltas(self, deltas):
+        """Ajuster les totaux des résumés concernés sans relire les résultats
+
+        Les écarts sont ajoutés en une requête UPDATE ; moyenne, pourcentage,
+        mention et admission des seuls résumés modifiés sont ensuite
+        recalculés par l'ORM.
+
+        :param deltas: dict {(exam_id, student_id): [notes, notes possibles, notes pondérées, coefficients]}
+        """
+        deltas = {key: values for key, values in deltas.items() if any(values)}
+        if not deltas:
+            return
+        totals = ['total_marks_obtained', 'total_marks_possible', 'total_weighted_marks', 'total_coefficients']
+        self.flush_model(totals + ['exam_id', 'student_id'])
+        keys = list(deltas)
+        columns = list(zip(*(deltas[key] for key in keys)))
+        self.env.cr.execute("""
+            UPDATE silina_exam_result_summary summary
+               SET total_marks_obtained = COALESCE(summary.total_marks_obtained, 0) + delta.marks,
+                   total_marks_possible = COALESCE(summary.total_marks_possible, 0) + delta.possible,
+                   total_weighted_marks = COALESCE(summary.total_weighted_marks, 0) + delta.weighted,
+                   total_coefficients = COALESCE(summary.total_coefficients, 0) + delta.coefficients,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::int[], %s::float8[], %s::float8[], %s::float8[], %s::float8[])
+                   AS delta(exam_id, student_id, marks, possible, weighted, coefficients)
+             WHERE summary.exam_id = delta.exam_id
+               AND summary.student_id = delta.student_id
+         RETURNING summary.id
+        """, [[key[0] for key in keys], [key[1] for key in keys], *map(list, columns)])
+        summaries = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if summaries:
+            summaries.invalidate_recordset(totals + ['write_date'])
+            summaries.modified(totals)
+
+    @api.model
+    def _recompute_totals_for_results(self, domain):
+        """Recalculer les totaux des résumés des résultats confirmés du domaine"""
+        pairs = {
+            (exam.id, student.id)
+            for exam, student in self.env['silina.exam.result']._read_group(
+                domain + [('state', '=', 'confirmed')], ['exam_id', 'student_id'])
+        }
+        if not pairs:
+            return
+        self.search([
+            ('exam_id', 'in', list({pair[0] for pair in pairs})),
+            ('student_id', 'in', list({pair[1] for pair in pairs})),
+        ]).filtered(lambda s: (s.exam_id.id, s.student_id.id) in pairs)._recompute_totals()
+
+    def _recompute_totals(self):
+        """Recalculer entièrement les totaux (changement de coefficient ou de barème)"""
+        totals = self._get_confirmed_totals(self.exam_id.ids, self.student_id.ids)
+        empty = dict.fromkeys(
+            ['total_marks_obtained', 'total_marks_possible', 'total_weighted_marks', 'total_coefficients'], 0.0)
         for record in self:
-            results = self.env['silina.exam.result'].search([
-                ('exam_id', '=', record.exam_id.id),
-                ('student_id', '=', record.student_id.id),
-                ('state', '=', 'confirmed')
-            ])
-            record.total_marks_obtained = sum(results.mapped('marks_obtained'))
-            record.total_marks_possible = sum(results.mapped('total_marks'))
-            record.total_weighted_marks = sum(results.mapped('weighted_marks'))
-            record.total_coefficients = sum(results.mapped('coefficient'))
+            record.write(totals.get((record.exam_id.id, record.student_id.id), empty))
 
     @api.depends('total_weighted_marks', 'total_coefficients')
     def _compute_average(self):
@@ -305,28 +538,65 @@ class ExamResultSummary(models.Model):
             else:
                 record.percentage = 0.0
 
-    @api.depends('average')
+    @api.depends('average', 'exam_id.total_marks')
     def _compute_grade(self):
+        GradeBand = self.env['silina.grade.band']
+        bands = GradeBand._get_bands()
         for record in self:
-            average = record.average
-            if average >= 18:
-                record.grade = 'Excellent'
-            elif average >= 16:
-                record.grade = 'Très Bien'
-            elif average >= 14:
-                record.grade = 'Bien'
-            elif average >= 12:
-                record.grade = 'Assez Bien'
-            elif average >= 10:
-                record.grade = 'Passable'
-            else:
-                record.grade = 'Insuffisant'
+            total_marks = record.exam_id.total_marks
+            percentage = record.average / total_marks * 100 if total_marks > 0 else 0.0
+            record.grade = GradeBand._get_grade(percentage, bands)
 
     @api.depends('average', 'exam_id.passing_marks')
     def _compute_is_passed(self):
         for record in self:
             record.is_passed = record.average >= record.exam_id.passing_marks
 
+    @api.model
+    def _compute_ranks(self, exam_ids, classroom_ids=None):
+        """Calculer les rangs par examen et par classe en une requête SQL
+
+        Les élèves de même moyenne partagent le même rang ; selon le mode de
+        classement de l'examen, le rang suivant est sauté (RANK) ou non
+        (DENSE_RANK).
+        """
+        if not exam_ids:
+            return
+        self.flush_model(['exam_id', 'classroom_id', 'average', 'rank'])
+        self.env['silina.exam'].flush_model(['rank_method'])
+
+        where = ["summary.exam_id IN %s", "summary.classroom_id IS NOT NULL"]
+        params = [tuple(exam_ids)]
+        if classroom_ids is not None:
+            if not classroom_ids:
+                return
+            where.append("summary.classroom_id IN %s")
+            params.append(tuple(classroom_ids))
+
+        self.env.cr.execute(f"""
+            UPDATE silina_exam_result_summary target
+               SET rank = ranked.rank,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (
+                    SELECT summary.id,
+                           CASE WHEN exam.rank_method = 'dense'
+                                THEN DENSE_RANK() OVER ranking
+                                ELSE RANK() OVER ranking
+                           END AS rank
+                      FROM silina_exam_result_summary summary
+                      JOIN silina_exam exam ON exam.id = summary.exam_id
+                     WHERE {' AND '.join(where)}
+                    WINDOW ranking AS (PARTITION BY summary.exam_id, summary.classroom_id
+                                       ORDER BY summary.average DESC NULLS LAST)
+                   ) ranked
+             WHERE target.id = ranked.id
+               AND target.rank IS DISTINCT FROM ranked.rank
+         RETURNING target.student_id
+        """, params)
+        student_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model(['rank', 'write_date'])
+        self.env['silina.student'].browse(student_ids)._invalidate_report_card_cache()
+
     @api.model
     def generate_summaries(self, exam_id):
         """Générer les résumés pour tous les élèves d'un examen"""
@@ -349,12 +619,9 @@ class ExamResultSummary(models.Model):
                 })
 
         if summaries:
-            created = self.create(summaries)
-            # Calculer les rangs par classe
-            for classroom in created.mapped('classroom_id'):
-                classroom_summaries = created.filtered(lambda s: s.classroom_id == classroom)
-                sorted_summaries = classroom_summaries.sorted(key=lambda s: s.average, reverse=True)
-                for rank, summary in enumerate(sorted_summaries, 1):
-                    summary.rank = rank
+            self.create(summaries)
+
+        # Calculer les rangs par classe
+        self._compute_ranks([exam_id])
 
         return True
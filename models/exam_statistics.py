@@ -0,0 +1,189 @@
+from odoo import models, fields, api, _
+
+
+class ExamStatistics(models.Model):
+    """Statistiques de classe par examen et par matière
+
+    Moyenne, extrêmes, écart type, médiane et taux de réussite des résultats
+    confirmés, calculés en une requête groupée. Les statistiques d'une
+    (examen, classe, matière) sont recalculées en fin de transaction
+    lorsqu'un de ses résultats confirmés change (voir ``exam_result.py``).
+    """
+    _name = 'silina.exam.statistics'
+    _description = 'Statistiques de Classe par Examen et Matière'
+    _order = 'exam_id, classroom_id, subject_id'
+
+    # Clé des statistiques à recalculer dans la transaction courante
+    _PRECOMMIT_KEY = 'silina.exam.statistics.keys'
+
+    exam_id = fields.Many2one(
+        'silina.exam',
+        string='Examen',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    classroom_id = fields.Many2one(
+        'silina.classroom',
+        string='Classe',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    subject_id = fields.Many2one(
+        'silina.subject',
+        string='Matière',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    student_count = fields.Integer(string='Élèves notés', readonly=True)
+    mean = fields.Float(string='Moyenne', readonly=True)
+    min_marks = fields.Float(string='Note minimale', readonly=True)
+    max_marks = fields.Float(string='Note maximale', readonly=True)
+    stddev = fields.Float(string='Écart type', readonly=True)
+    median = fields.Float(string='Médiane', readonly=True)
+    pass_rate = fields.Float(string='Taux de réussite (%)', readonly=True)
+
+    _sql_constraints = [
+        ('statistics_unique', 'unique(exam_id, classroom_id, subject_id)',
+         'Une seule ligne de statistiques par examen, classe et matière!'),
+    ]
+
+    @api.model
+    def _refresh_exams(self, exam_ids):
+        """Recalculer toutes les statistiques des examens donnés"""
+        if not exam_ids:
+            return
+        self.env['silina.exam.result'].flush_model(['exam_id', 'classroom_id', 'subject_id'])
+        self.flush_model(['exam_id', 'classroom_id', 'subject_id'])
+        self.env.cr.execute("""
+            SELECT exam_id, classroom_id, subject_id
+              FROM silina_exam_result
+             WHERE exam_id = ANY(%(exam_ids)s) AND classroom_id IS NOT NULL
+             UNION
+            SELECT exam_id, classroom_id, subject_id
+              FROM silina_exam_statistics
+             WHERE exam_id = ANY(%(exam_ids)s)
+        """, {'exam_ids': list(exam_ids)})
+        self._refresh_keys(self.env.cr.fetchall())
+
+    @api.model
+    def _refresh_keys(self, keys):
+        """Recalculer en une requête les statistiques des (examen, classe, matière) donnés
+
+        Les lignes sans résultat confirmé sont supprimées.
+        """
+        keys = [key for key in set(keys) if all(key)]
+        if not keys:
+            return
+        self.env['silina.exam.result'].flush_model(
+            ['exam_id', 'classroom_id', 'subject_id', 'state', 'marks_obtained', 'is_passed'])
+        self.flush_model()
+
+        exam_ids, classroom_ids, subject_ids = (list(column) for column in zip(*keys))
+        self.env.cr.execute("""
+            WITH keys AS (
+                SELECT *
+                  FROM unnest(%(exam_ids)s::int[], %(classroom_ids)s::int[], %(subject_ids)s::int[])
+                       AS k(exam_id, classroom_id, subject_id)
+            ), stats AS (
+                SELECT result.exam_id,
+                       result.classroom_id,
+                       result.subject_id,
+                       COUNT(*) AS student_count,
+                       AVG(result.marks_obtained) AS mean,
+                       MIN(result.marks_obtained) AS min_marks,
+                       MAX(result.marks_obtained) AS max_marks,
+                       COALESCE(STDDEV_POP(result.marks_obtained), 0) AS stddev,
+                       PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY result.marks_obtained) AS median,
+                       100.0 * COUNT(*) FILTER (WHERE result.is_passed) / COUNT(*) AS pass_rate
+                  FROM silina_exam_result result
+                  JOIN keys ON keys.exam_id = result.exam_id
+                           AND keys.classroom_id = result.classroom_id
+                           AND keys.subject_id = result.subject_id
+                 WHERE result.state = 'confirmed'
+              GROUP BY result.exam_id, result.classroom_id, result.subject_id
+            ), upserted AS (
+                INSERT INTO silina_exam_statistics
+                       (exam_id, classroom_id, subject_id, student_count, mean, min_marks, max_marks,
+                        stddev, median, pass_rate, create_uid, create_date, write_uid, write_date)
+                SELECT exam_id, classroom_id, subject_id, student_count, mean, min_marks, max_marks,
+                       stddev, median, pass_rate,
+                       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                  FROM stats
+                    ON CONFLICT (exam_id, classroom_id, subject_id) DO UPDATE
+                   SET student_count = EXCLUDED.student_count,
+                       mean = EXCLUDED.mean,
+                       min_marks = EXCLUDED.min_marks,
+                       max_marks = EXCLUDED.max_marks,
+                       stddev = EXCLUDED.stddev,
+                       median = EXCLUDED.median,
+                       pass_rate = EXCLUDED.pass_rate,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                RETURNING id
+            )
+            DELETE FROM silina_exam_statistics statistics
+             USING keys
+             WHERE statistics.exam_id = keys.exam_id
+               AND statistics.classroom_id = keys.classroom_id
+               AND statistics.subject_id = keys.subject_id
+               AND NOT EXISTS (
+                    SELECT 1 FROM stats
+                     WHERE stats.exam_id = keys.exam_id
+                       AND stats.classroom_id = keys.classroom_id
+                       AND stats.subject_id = keys.subject_id
+               )
+        """, {
+            'exam_ids': exam_ids,
+            'classroom_ids': classroom_ids,
+            'subject_ids': subject_ids,
+            'uid': self.env.uid,
+        })
+        self.invalidate_model()
+
+    @api.model
+    def _mark_dirty(self, keys):
+        """Planifier, en fin de transaction, le recalcul des statistiques concernées
+
+        Les clés sont accumulées pour ne recalculer chaque (examen, classe,
+        matière) qu'une fois par transaction.
+        """
+        keys = {key for key in keys if all(key)}
+        if not keys:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get(self._PRECOMMIT_KEY)
+        if pending is None:
+            pending = data[self._PRECOMMIT_KEY] = set()
+            self.env.cr.precommit.add(self._refresh_dirty)
+        pending.update(keys)
+
+    @api.model
+    def _refresh_dirty(self):
+        keys = self.env.cr.precommit.data.pop(self._PRECOMMIT_KEY, set())
+        self.sudo()._refresh_keys(keys)
+        self._invalidate_report_cards(keys)
+
+    @api.model
+    def _invalidate_report_cards(self, keys):
+        """Invalider les bulletins de tous les élèves notés des (examen, classe, matière) donnés
+
+        Les statistiques de classe figurent sur le bulletin de chaque élève de
+        la classe : une note modifiée change aussi les bulletins des camarades.
+        """
+        keys = [key for key in set(keys) if all(key)]
+        if not keys:
+            return
+        exam_ids, classroom_ids, subject_ids = (list(column) for column in zip(*keys))
+        self.env.cr.execute("""
+            SELECT DISTINCT result.student_id
+              FROM silina_exam_result result
+              JOIN unnest(%s::int[], %s::int[], %s::int[]) AS k(exam_id, classroom_id, subject_id)
+                ON k.exam_id = result.exam_id
+               AND k.classroom_id = result.classroom_id
+               AND k.subject_id = result.subject_id
+        """, [exam_ids, classroom_ids, subject_ids])
+        self.env['silina.student'].browse([row[0] for row in self.env.cr.fetchall()])._invalidate_report_card_cache()
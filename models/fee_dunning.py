@@ -0,0 +1,308 @@
+import base64
+import csv
+import io
+import logging
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+from odoo.tools import format_date
+
+_logger = logging.getLogger(__name__)
+
+
+class FeeDunning(models.Model):
+    """Campagne de relance des tranches de frais en retard
+
+    Les tranches en retard sont lues en une requête sur les soldes des
+    élèves (index partiel sur les échéances restant dues) et insérées
+    directement comme lignes de relance, rattachées au parent responsable
+    financier de chaque élève. Les lettres (un PDF, une page par parent)
+    et l'export CSV sont produits en un seul rendu pour toute la campagne.
+    """
+    _name = 'silina.fee.dunning'
+    _description = 'Relance des Frais Impayés'
+    _order = 'date desc, id desc'
+
+    name = fields.Char(
+        string='Nom',
+        required=True,
+        default=lambda self: _('Relance du %s') % format_date(self.env, fields.Date.context_today(self))
+    )
+
+    date = fields.Date(
+        string='Date de relance',
+        required=True,
+        default=fields.Date.context_today
+    )
+
+    grace_days = fields.Integer(
+        string='Jours de grâce',
+        default=lambda self: self._default_grace_days(),
+        help="Une tranche n'est relancée qu'après ce nombre de jours de retard"
+    )
+
+    academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année Scolaire',
+        help="Limiter la relance à cette année scolaire (toutes sinon)"
+    )
+    fee_type_id = fields.Many2one(
+        'silina.fee.type',
+        string='Type de frais',
+        help="Limiter la relance à ce type de frais (tous sinon)"
+    )
+
+    line_ids = fields.One2many(
+        'silina.fee.dunning.line',
+        'dunning_id',
+        string='Tranches en retard',
+        readonly=True
+    )
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Devise',
+        default=lambda self: self.env.company.currency_id
+    )
+    parent_count = fields.Integer(string='Parents relancés', compute='_compute_totals')
+    student_count = fields.Integer(string='Élèves concernés', compute='_compute_totals')
+    total_amount = fields.Monetary(
+        string='Montant en retard',
+        currency_field='currency_id',
+        compute='_compute_totals'
+    )
+
+    letters_file = fields.Binary(string='Lettres de relance', attachment=True, readonly=True)
+    letters_filename = fields.Char(string='Nom du fichier PDF')
+    csv_file = fields.Binary(string='Export CSV', attachment=True, readonly=True)
+    csv_filename = fields.Char(string='Nom du fichier CSV')
+
+    state = fields.Selection([
+        ('draft', 'Brouillon'),
+        ('done', 'Générée'),
+    ], string='État', default='draft', readonly=True)
+
+    @api.model
+    def _default_grace_days(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('silina_edu.dunning_grace_days', 0))
+
+    @api.depends('line_ids')
+    def _compute_totals(self):
+        Line = self.env['silina.fee.dunning.line']
+        totals = {
+            dunning.id: (parent_count, student_count, amount)
+            for dunning, parent_count, student_count, amount in Line._read_group(
+                [('dunning_id', 'in', self.ids)], ['dunning_id'],
+                ['parent_id:count_distinct', 'student_id:count_distinct', 'amount_residual:sum'])
+        }
+        for record in self:
+            record.parent_count, record.student_count, record.total_amount = totals.get(record.id, (0, 0, 0.0))
+
+    def action_generate(self):
+        for record in self:
+            record._generate()
+        return True
+
+    def action_view_lines(self):
+        self.ensure_one()
+        return {
+            'name': _('Tranches en retard - %s') % self.name,
+            'type': 'ir.actions.act_window',
+            'res_model': 'silina.fee.dunning.line',
+            'view_mode': 'list',
+            'domain': [('dunning_id', '=', self.id)],
+            'context': {'search_default_group_parent': 1},
+        }
+
+    def _generate(self):
+        """Recenser les tranches en retard puis produire les lettres et l'export CSV"""
+        self.ensure_one()
+        if not self._collect_lines():
+            raise ValidationError(_('Aucune tranche en retard à relancer!'))
+        self._render_documents()
+
+    def _render_documents(self):
+        """Rendre en une fois les lettres (PDF, une page par parent) et l'export CSV"""
+        self.ensure_one()
+        report = self.env.ref('silina_edu.action_report_fee_dunning')
+        pdf_content, dummy = self.env['ir.actions.report']._render_qweb_pdf(report.report_name, res_ids=self.ids)
+        filename = self.name.replace('/', '-')
+        self.write({
+            'letters_file': base64.b64encode(pdf_content),
+            'letters_filename': f"{filename}.pdf",
+            'csv_file': base64.b64encode(self._build_csv()),
+            'csv_filename': f"{filename}.csv",
+            'state': 'done',
+        })
+
+    def _collect_lines(self):
+        """Insérer en une requête les tranches en retard comme lignes de relance
+
+        Chaque élève est rattaché à son parent responsable financier (à
+        défaut, à son premier parent).
+
+        :return: nombre de lignes créées
+        """
+        self.ensure_one()
+        Ledger = self.env['silina.student.fee.ledger']
+        Ledger._refresh_dirty()
+        Ledger.flush_model()
+        self.env['silina.student'].flush_model(['active', 'classroom_id', 'parent_ids'])
+        self.env['silina.parent'].flush_model(['active', 'is_financial_responsible'])
+        Line = self.env['silina.fee.dunning.line']
+        Line.flush_model()
+
+        where = ["ledger.amount_residual > 0", "ledger.due_date < %(limit_date)s", "student.active"]
+        if self.academic_year_id:
+            where.append("ledger.academic_year_id = %(academic_year_id)s")
+        if self.fee_type_id:
+            where.append("ledger.fee_type_id = %(fee_type_id)s")
+
+        self.env.cr.execute("DELETE FROM silina_fee_dunning_line WHERE dunning_id = %s", [self.id])
+        self.env.cr.execute(f"""
+            INSERT INTO silina_fee_dunning_line
+                   (dunning_id, parent_id, student_id, classroom_id, fee_type_id, installment_id, currency_id,
+                    due_date, days_overdue, amount_residual, create_uid, create_date, write_uid, write_date)
+            SELECT %(dunning_id)s,
+                   responsible.parent_id,
+                   ledger.student_id,
+                   student.classroom_id,
+                   ledger.fee_type_id,
+                   ledger.installment_id,
+                   ledger.currency_id,
+                   ledger.due_date,
+                   %(date)s - ledger.due_date,
+                   ledger.amount_residual,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM silina_student_fee_ledger ledger
+              JOIN silina_student student ON student.id = ledger.student_id
+         LEFT JOIN LATERAL (
+                    SELECT parent.id AS parent_id
+                      FROM student_parent_rel rel
+                      JOIN silina_parent parent ON parent.id = rel.parent_id
+                     WHERE rel.student_id = ledger.student_id
+                       AND parent.active
+                  ORDER BY parent.is_financial_responsible DESC, parent.id
+                     LIMIT 1
+                   ) responsible ON TRUE
+             WHERE {' AND '.join(where)}
+        """, {
+            'dunning_id': self.id,
+            'date': self.date,
+            'limit_date': fields.Date.subtract(self.date, days=self.grace_days),
+            'academic_year_id': self.academic_year_id.id,
+            'fee_type_id': self.fee_type_id.id,
+            'uid': self.env.uid,
+        })
+        count = self.env.cr.rowcount
+        Line.invalidate_model()
+        self.invalidate_recordset(['line_ids'])
+        return count
+
+    def _get_letter_groups(self):
+        """Lignes de relance regroupées par parent, en une requête
+
+        Un élève sans parent actif reçoit sa propre lettre : ses lignes ne
+        sont jamais regroupées avec celles d'autres familles.
+
+        :return: liste de dicts {'parent': silina.parent, 'lines': [...], 'total': montant}
+        """
+        self.ensure_one()
+        groups = {}
+        for line in self.env['silina.fee.dunning.line'].search_read(
+                [('dunning_id', '=', self.id)],
+                ['parent_id', 'student_id', 'classroom_id', 'fee_type_id', 'installment_id',
+                 'due_date', 'days_overdue', 'amount_residual'],
+                order='parent_id, student_id, due_date'):
+            key = ('parent', line['parent_id'][0]) if line['parent_id'] else ('student', line['student_id'][0])
+            group = groups.setdefault(key, {'lines': [], 'total': 0.0})
+            group['lines'].append({
+                'student': line['student_id'][1],
+                'classroom': line['classroom_id'][1] if line['classroom_id'] else '',
+                'fee_type': line['fee_type_id'][1] if line['fee_type_id'] else '',
+                'installment': line['installment_id'][1] if line['installment_id'] else '',
+                'due_date': line['due_date'],
+                'days_overdue': line['days_overdue'],
+                'amount_residual': line['amount_residual'],
+            })
+            group['total'] += line['amount_residual']
+
+        # Parents du lot chargés en une fois (adresse et contacts des lettres)
+        parents = self.env['silina.parent'].browse([key[1] for key in groups if key[0] == 'parent'])
+        parents.fetch(['name', 'street', 'street2', 'zip', 'city', 'phone', 'mobile', 'email'])
+        return [
+            dict(group, parent=parents.browse(key[1]) if key[0] == 'parent' else parents.browse())
+            for key, group in groups.items()
+        ]
+
+    def _build_csv(self):
+        """Export CSV des lignes de relance (une ligne par tranche en retard)"""
+        self.ensure_one()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        writer.writerow([
+            _('Parent'), _('Téléphone'), _('Email'), _('Élève'), _('Classe'), _('Type de frais'),
+            _('Tranche'), _('Échéance'), _('Jours de retard'), _('Reste à payer'),
+        ])
+        for group in self._get_letter_groups():
+            parent = group['parent']
+            for line in group['lines']:
+                writer.writerow([
+                    parent.name or '', parent.mobile or parent.phone or '', parent.email or '',
+                    line['student'], line['classroom'], line['fee_type'], line['installment'],
+                    fields.Date.to_string(line['due_date']), line['days_overdue'], line['amount_residual'],
+                ])
+        return buffer.getvalue().encode('utf-8-sig')
+
+    @api.model
+    def _cron_generate_dunning(self):
+        """Point d'entrée du cron (hebdomadaire) : une campagne de relance s'il y a des retards
+
+        Au plus une campagne par date, même si le cron est lancé manuellement.
+        """
+        today = fields.Date.context_today(self)
+        if self.search_count([('date', '=', today)]):
+            return
+        dunning = self.create({'date': today})
+        if not dunning._collect_lines():
+            dunning.unlink()
+            return
+        dunning._render_documents()
+        _logger.info("Relance %s: %s parents, %s élèves", dunning.name, dunning.parent_count, dunning.student_count)
+
+
+class FeeDunningLine(models.Model):
+    _name = 'silina.fee.dunning.line'
+    _description = 'Tranche en Retard d\'une Relance'
+    _order = 'dunning_id, parent_id, student_id, due_date'
+
+    dunning_id = fields.Many2one(
+        'silina.fee.dunning',
+        string='Relance',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    parent_id = fields.Many2one(
+        'silina.parent',
+        string='Parent',
+        ondelete='set null',
+        help="Parent responsable financier à qui la relance est adressée"
+    )
+    student_id = fields.Many2one(
+        'silina.student',
+        string='Élève',
+        required=True,
+        ondelete='cascade'
+    )
+    classroom_id = fields.Many2one('silina.classroom', string='Classe')
+    fee_type_id = fields.Many2one('silina.fee.type', string='Type de frais')
+    installment_id = fields.Many2one('silina.fee.type.installment', string='Tranche')
+
+    currency_id = fields.Many2one('res.currency', string='Devise')
+    due_date = fields.Date(string='Échéance')
+    days_overdue = fields.Integer(string='Jours de retard')
+    amount_residual = fields.Monetary(
+        string='Reste à payer',
+        currency_field='currency_id'
+    )
@@ -0,0 +1,140 @@
+from odoo import models, fields, api, _
+
+
+class FinancialSnapshot(models.Model):
+    """Synthèse financière matérialisée par année scolaire
+
+    Les montants sont agrégés en une requête SQL à partir des soldes des
+    élèves (``silina.student.fee.ledger``), pour les seules années dont des
+    soldes ont changé lors de la transaction (validation, annulation, remise
+    en brouillon ou lettrage d'une facture de frais), de sorte que le tableau
+    de bord n'a qu'une ligne à lire.
+    """
+    _name = 'silina.financial.snapshot'
+    _description = 'Synthèse Financière par Année Scolaire'
+    _order = 'academic_year_id desc'
+    _rec_name = 'academic_year_id'
+
+    # Clé des années scolaires modifiées dans la transaction courante
+    _PRECOMMIT_KEY = 'silina.financial.snapshot.years'
+
+    academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année Scolaire',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Devise',
+        default=lambda self: self.env.company.currency_id
+    )
+
+    expected_amount = fields.Monetary(
+        string='Montant Total Attendu',
+        currency_field='currency_id'
+    )
+    paid_amount = fields.Monetary(
+        string='Montant Total Payé',
+        currency_field='currency_id'
+    )
+    debt_amount = fields.Monetary(
+        string='Montant Total des Dettes',
+        currency_field='currency_id'
+    )
+    payment_rate = fields.Float(
+        string='Taux de Paiement (%)'
+    )
+    debtor_count = fields.Integer(
+        string='Élèves avec Dettes'
+    )
+
+    date_computed = fields.Datetime(
+        string='Dernier calcul',
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('academic_year_unique', 'unique(academic_year_id)',
+         'Une seule synthèse financière par année scolaire!'),
+    ]
+
+    @api.model
+    def _compute_values(self, academic_year_ids=None):
+        """Agréger en une requête les soldes des élèves d'une ou plusieurs années
+
+        :param academic_year_ids: années à agréger (toutes si None)
+        :return: dict des valeurs de la synthèse
+        """
+        self.env['silina.student.fee.ledger'].flush_model()
+        self.env['silina.student'].flush_model(['active'])
+
+        where = "TRUE"
+        params = []
+        if academic_year_ids is not None:
+            where = "ledger.academic_year_id = ANY(%s)"
+            params.append(list(academic_year_ids))
+
+        self.env.cr.execute(f"""
+            SELECT COALESCE(SUM(ledger.amount_invoiced), 0),
+                   COALESCE(SUM(ledger.amount_residual), 0),
+                   COUNT(DISTINCT ledger.student_id) FILTER (WHERE ledger.amount_residual > 0 AND student.active)
+              FROM silina_student_fee_ledger ledger
+              JOIN silina_student student ON student.id = ledger.student_id
+             WHERE {where}
+        """, params)
+        expected, debt, debtor_count = self.env.cr.fetchone()
+        paid = expected - debt
+        return {
+            'expected_amount': expected,
+            'paid_amount': paid,
+            'debt_amount': debt,
+            'payment_rate': (paid / expected) * 100 if expected > 0 else 0.0,
+            'debtor_count': debtor_count,
+        }
+
+    @api.model
+    def _get_for_year(self, academic_year):
+        """Retourner la synthèse d'une année, en la créant au premier accès"""
+        snapshot = self.search([('academic_year_id', '=', academic_year.id)], limit=1)
+        if not snapshot:
+            snapshot = self.sudo().create({'academic_year_id': academic_year.id})
+            snapshot._refresh()
+        return snapshot
+
+    def _refresh(self):
+        """Recalculer les synthèses à partir des soldes des élèves"""
+        # Appliquer d'abord les recalculs de soldes en attente dans la transaction
+        self.env['silina.student.fee.ledger']._refresh_dirty()
+        for record in self:
+            values = self._compute_values([record.academic_year_id.id])
+            values['date_computed'] = fields.Datetime.now()
+            record.write(values)
+
+    @api.model
+    def _mark_dirty(self, academic_year_ids):
+        """Planifier, en fin de transaction, le recalcul des synthèses de ces années
+
+        Les années sont accumulées pour ne recalculer chaque synthèse qu'une
+        seule fois par transaction, quel que soit le nombre de factures modifiées.
+        """
+        academic_year_ids = {year_id for year_id in academic_year_ids if year_id}
+        if not academic_year_ids:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get(self._PRECOMMIT_KEY)
+        if pending is None:
+            pending = data[self._PRECOMMIT_KEY] = set()
+            self.env.cr.precommit.add(self._refresh_dirty)
+        pending.update(academic_year_ids)
+
+    @api.model
+    def _refresh_dirty(self):
+        academic_year_ids = self.env.cr.precommit.data.pop(self._PRECOMMIT_KEY, set())
+        if not academic_year_ids:
+            return
+        snapshots = self.sudo().search([('academic_year_id', 'in', list(academic_year_ids))])
+        snapshots._refresh()
+        snapshots.flush_model()
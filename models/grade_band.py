@@ -0,0 +1,105 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+
+class GradeBand(models.Model):
+    """Mention attribuée à partir d'un pourcentage minimal
+
+    Les mentions des résultats et des résumés sont lues dans cette table au
+    lieu de seuils codés en dur. Toute modification recalcule, en une
+    requête et une seule fois en fin de transaction, les mentions des
+    examens des années non clôturées.
+    """
+    _name = 'silina.grade.band'
+    _description = 'Mention'
+    _order = 'min_percentage desc'
+
+    # Marqueur du recalcul des mentions en attente dans la transaction courante
+    _PRECOMMIT_KEY = 'silina.grade.band.recompute'
+
+    name = fields.Char(
+        string='Mention',
+        required=True
+    )
+    min_percentage = fields.Float(
+        string='Pourcentage minimal',
+        required=True,
+        help="Pourcentage à partir duquel la mention est attribuée (ex: 90 pour 18/20)"
+    )
+    active = fields.Boolean(default=True)
+
+    _sql_constraints = [
+        ('min_percentage_unique', 'unique(min_percentage)',
+         'Deux mentions ne peuvent pas avoir le même pourcentage minimal!'),
+    ]
+
+    @api.constrains('min_percentage')
+    def _check_min_percentage(self):
+        for record in self:
+            if not 0 <= record.min_percentage <= 100:
+                raise ValidationError(_('Le pourcentage minimal doit être compris entre 0 et 100!'))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        bands = super().create(vals_list)
+        self._mark_grades_dirty()
+        return bands
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'name', 'min_percentage', 'active'} & vals.keys():
+            self._mark_grades_dirty()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._mark_grades_dirty()
+        return res
+
+    @api.model
+    def _get_bands(self):
+        """Mentions actives, de la plus haute à la plus basse
+
+        :return: liste de tuples (pourcentage minimal, mention)
+        """
+        # Indépendant du contexte de l'appelant (le menu des mentions affiche aussi les archivées),
+        # comme la requête SQL de recalcul qui ne lit que les mentions actives
+        return [(band['min_percentage'], band['name'])
+                for band in self.with_context(active_test=False).search_read(
+                    [('active', '=', True)], ['min_percentage', 'name'], order='min_percentage desc')]
+
+    @api.model
+    def _get_grade(self, percentage, bands=None):
+        """Mention correspondant à un pourcentage (``bands`` évite de relire la table dans une boucle)"""
+        for min_percentage, name in (bands if bands is not None else self._get_bands()):
+            if percentage >= min_percentage:
+                return name
+        return False
+
+    @api.model
+    def _mark_grades_dirty(self):
+        """Planifier, en fin de transaction, le recalcul des mentions
+
+        Le recalcul n'est exécuté qu'une fois par transaction, quel que soit
+        le nombre de mentions créées, modifiées ou supprimées.
+        """
+        data = self.env.cr.precommit.data
+        if not data.get(self._PRECOMMIT_KEY):
+            data[self._PRECOMMIT_KEY] = True
+            self.env.cr.precommit.add(self._recompute_dirty_grades)
+
+    @api.model
+    def _recompute_dirty_grades(self):
+        if self.env.cr.precommit.data.pop(self._PRECOMMIT_KEY, False):
+            self.sudo().with_context(active_test=True)._recompute_open_grades()
+
+    @api.model
+    def _recompute_open_grades(self):
+        """Recalculer les mentions des examens des années scolaires non clôturées"""
+        exams = self.env['silina.exam'].search([('academic_year_id.state', '!=', 'closed')])
+        if not exams:
+            return
+        self.env['silina.exam.result']._bulk_recompute(exam_ids=exams.ids)
+        summaries = self.env['silina.exam.result.summary'].search([('exam_id', 'in', exams.ids)])
+        self.env.add_to_compute(summaries._fields['grade'], summaries)
+        summaries.flush_recordset(['grade'])
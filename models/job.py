@@ -0,0 +1,321 @@
+import logging
+import time
+
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError, ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+class Job(models.Model):
+    """Tâche exécutée en arrière-plan par le cron, lot par lot
+
+    Une tâche appelle ``method_name`` sur le modèle ``res_model`` pour chaque
+    lot d'identifiants de ``record_ids``. La méthode reçoit la tâche et la
+    liste des identifiants du lot, et retourne la liste des erreurs du lot.
+    La position est enregistrée après chaque lot : une tâche interrompue
+    (redémarrage du serveur) reprend au lot suivant.
+    """
+    _name = 'silina.job'
+    _description = 'Tâche en Arrière-plan'
+    _order = 'id desc'
+    _inherit = ['mail.thread']
+
+    # Durée maximale (secondes) d'un passage du cron avant de rendre la main
+    _job_time_limit = 240
+
+    # Modèles dont les méthodes _job_* peuvent être exécutées en arrière-plan
+    _job_models = (
+        'silina.generate.fee.invoices.wizard',
+        'silina.generate.report.card.wizard',
+        'silina.bulk.student.promotion.wizard',
+    )
+
+    name = fields.Char(
+        string='Nom',
+        required=True
+    )
+
+    res_model = fields.Char(
+        string='Modèle',
+        required=True,
+        readonly=True
+    )
+    method_name = fields.Char(
+        string='Méthode',
+        required=True,
+        readonly=True,
+        help="Méthode appelée pour chaque lot (doit commencer par _job_)"
+    )
+    prepare_method = fields.Char(
+        string='Méthode de préparation',
+        readonly=True,
+        help="Méthode appelée une seule fois avant le premier lot"
+    )
+    finalize_method = fields.Char(
+        string='Méthode de finalisation',
+        readonly=True,
+        help="Méthode appelée une seule fois après le dernier lot"
+    )
+    payload = fields.Json(
+        string='Paramètres',
+        readonly=True
+    )
+    record_ids = fields.Json(
+        string='Enregistrements',
+        readonly=True
+    )
+
+    chunk_size = fields.Integer(
+        string='Taille des lots',
+        default=100,
+        required=True
+    )
+    next_index = fields.Integer(
+        string='Position',
+        default=0,
+        readonly=True,
+        help="Nombre d'enregistrements déjà traités"
+    )
+    is_prepared = fields.Boolean(
+        string='Préparée',
+        default=False,
+        readonly=True
+    )
+
+    total_count = fields.Integer(
+        string='Total',
+        readonly=True
+    )
+    processed_count = fields.Integer(
+        string='Traités',
+        readonly=True
+    )
+    failed_count = fields.Integer(
+        string='Échecs',
+        readonly=True
+    )
+    progress = fields.Float(
+        string='Progression',
+        compute='_compute_progress'
+    )
+
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échouée'),
+        ('cancelled', 'Annulée'),
+    ], string='État', default='pending', required=True, tracking=True)
+
+    user_id = fields.Many2one(
+        'res.users',
+        string='Utilisateur',
+        default=lambda self: self.env.user,
+        required=True,
+        readonly=True
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Société',
+        default=lambda self: self.env.company,
+        required=True,
+        readonly=True
+    )
+
+    date_start = fields.Datetime(string='Début', readonly=True)
+    date_end = fields.Datetime(string='Fin', readonly=True)
+    error_log = fields.Text(string='Erreurs', readonly=True)
+
+    attachment_ids = fields.One2many(
+        'ir.attachment',
+        'res_id',
+        string='Fichiers générés',
+        domain=[('res_model', '=', 'silina.job')]
+    )
+
+    @api.depends('processed_count', 'failed_count', 'total_count', 'state')
+    def _compute_progress(self):
+        for record in self:
+            if record.total_count > 0:
+                record.progress = (record.processed_count + record.failed_count) / record.total_count * 100
+            else:
+                record.progress = 100.0 if record.state == 'done' else 0.0
+
+    @api.constrains('method_name', 'prepare_method', 'finalize_method')
+    def _check_method_name(self):
+        for record in self:
+            for method in (record.method_name, record.prepare_method, record.finalize_method):
+                if method and not method.startswith('_job_'):
+                    raise ValidationError(_('La méthode %s ne peut pas être exécutée en arrière-plan!') % method)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # La tâche s'exécute toujours avec les droits de l'utilisateur qui la crée
+        for vals in vals_list:
+            if vals.get('res_model') not in self._job_models:
+                raise AccessError(_('Le modèle %s ne peut pas être exécuté en arrière-plan!') % vals.get('res_model'))
+            vals['user_id'] = self.env.uid
+        return super().create(vals_list)
+
+    def write(self, vals):
+        protected = {'res_model', 'method_name', 'prepare_method', 'finalize_method', 'user_id', 'company_id'}
+        if protected.intersection(vals) and not self.env.su:
+            raise AccessError(_("Le modèle, les méthodes et l'utilisateur d'une tâche ne peuvent pas être modifiés!"))
+        return super().write(vals)
+
+    @api.model
+    def enqueue(self, name, res_model, method_name, record_ids, payload=None, prepare_method=False,
+                finalize_method=False, chunk_size=None):
+        """Créer une tâche et réveiller le cron pour la démarrer au plus tôt"""
+        vals = {
+            'name': name,
+            'res_model': res_model,
+            'method_name': method_name,
+            'prepare_method': prepare_method,
+            'finalize_method': finalize_method,
+            'payload': payload or {},
+            'record_ids': list(record_ids),
+            'total_count': len(record_ids),
+        }
+        if chunk_size:
+            vals['chunk_size'] = chunk_size
+        job = self.create(vals)
+        self._trigger_worker()
+        return job
+
+    def get_payload(self):
+        self.ensure_one()
+        return dict(self.payload or {})
+
+    def action_open(self):
+        """Ouvrir la tâche (l'utilisateur peut fermer la fenêtre et revenir plus tard)"""
+        self.ensure_one()
+        return {
+            'name': _('Tâche en arrière-plan'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'silina.job',
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def action_cancel(self):
+        self.filtered(lambda j: j.state in ('pending', 'running')).write({
+            'state': 'cancelled',
+            'date_end': fields.Datetime.now(),
+        })
+        return True
+
+    def action_resume(self):
+        """Relancer une tâche annulée ou échouée à partir du dernier lot traité"""
+        self.filtered(lambda j: j.state in ('failed', 'cancelled')).write({
+            'state': 'pending',
+            'date_end': False,
+        })
+        self._trigger_worker()
+        return True
+
+    def action_refresh(self):
+        return True
+
+    @api.model
+    def _trigger_worker(self):
+        cron = self.env.ref('silina_edu.ir_cron_silina_job_worker', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Point d'entrée du cron : traiter les tâches en attente jusqu'à la limite de temps"""
+        started = time.monotonic()
+        while time.monotonic() - started < self._job_time_limit:
+            job = self._acquire_next_job()
+            if not job:
+                return
+            job._run_next_chunk()
+            self.env.cr.commit()
+        # Il reste du travail : se replanifier immédiatement
+        self._trigger_worker()
+
+    @api.model
+    def _acquire_next_job(self):
+        """Verrouiller la prochaine tâche à traiter (ignorée si un autre worker la traite)"""
+        self.env.cr.execute("""
+            SELECT id FROM silina_job
+             WHERE state IN ('pending', 'running')
+          ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _run_next_chunk(self):
+        """Traiter un lot de la tâche et enregistrer la progression"""
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+
+        model = self.env[self.res_model].with_user(self.user_id).with_company(self.company_id)
+
+        if self.prepare_method and not self.is_prepared:
+            try:
+                with self.env.cr.savepoint():
+                    getattr(model, self.prepare_method)(self)
+            except Exception as e:
+                _logger.exception("Préparation de la tâche %s échouée", self.id)
+                self._finish('failed', str(e))
+                return
+            # La préparation est validée (commit) avant le premier lot
+            self.is_prepared = True
+            return
+
+        record_ids = self.record_ids or []
+        chunk = record_ids[self.next_index:self.next_index + self.chunk_size]
+        if not chunk:
+            self._finalize()
+            return
+
+        try:
+            with self.env.cr.savepoint():
+                errors = getattr(model, self.method_name)(self, chunk) or []
+        except Exception as e:
+            _logger.exception("Lot de la tâche %s échoué", self.id)
+            errors = [str(e)] * len(chunk)
+
+        vals = {
+            'next_index': self.next_index + len(chunk),
+            'processed_count': self.processed_count + len(chunk) - min(len(errors), len(chunk)),
+            'failed_count': self.failed_count + min(len(errors), len(chunk)),
+        }
+        if errors:
+            vals['error_log'] = '\n'.join(filter(None, [self.error_log] + list(dict.fromkeys(errors))))
+        self.write(vals)
+
+    def _finalize(self):
+        """Exécuter la méthode de finalisation puis terminer la tâche"""
+        self.ensure_one()
+        if self.finalize_method:
+            model = self.env[self.res_model].with_user(self.user_id).with_company(self.company_id)
+            try:
+                with self.env.cr.savepoint():
+                    getattr(model, self.finalize_method)(self)
+            except Exception as e:
+                _logger.exception("Finalisation de la tâche %s échouée", self.id)
+                self._finish('failed', str(e))
+                return
+        self._finish('done')
+
+    def _finish(self, state, message=False):
+        self.ensure_one()
+        vals = {'state': state, 'date_end': fields.Datetime.now()}
+        if message:
+            vals['error_log'] = '\n'.join(filter(None, [self.error_log, message]))
+        self.write(vals)
+        body = _('Tâche terminée: %(processed)s traités, %(failed)s en échec sur %(total)s.') % {
+            'processed': self.processed_count,
+            'failed': self.failed_count,
+            'total': self.total_count,
+        }
+        self.message_post(body=body, partner_ids=self.user_id.partner_id.ids)
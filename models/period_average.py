@@ -0,0 +1,275 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+
+class GradingPeriod(models.Model):
+    """Période d'évaluation (trimestre, semestre, année) regroupant plusieurs examens pondérés"""
+    _name = 'silina.grading.period'
+    _description = 'Période d\'Évaluation'
+    _order = 'academic_year_id desc, sequence, id'
+
+    name = fields.Char(
+        string='Nom',
+        required=True,
+        help="Ex: 1er Trimestre, Moyenne annuelle"
+    )
+
+    academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année Scolaire',
+        required=True,
+        ondelete='cascade',
+        default=lambda self: self.env['silina.academic.year'].get_current_year()
+    )
+
+    period_type = fields.Selection([
+        ('term', 'Trimestre'),
+        ('semester', 'Semestre'),
+        ('annual', 'Année'),
+    ], string='Type', default='term', required=True)
+
+    sequence = fields.Integer(string='Séquence', default=10)
+
+    exam_line_ids = fields.One2many(
+        'silina.grading.period.exam',
+        'period_id',
+        string='Examens',
+        copy=True
+    )
+
+    passing_average = fields.Float(
+        string='Moyenne de passage',
+        default=10.0,
+        help="Moyenne minimale de la période pour être admis"
+    )
+
+    average_ids = fields.One2many(
+        'silina.period.average',
+        'period_id',
+        string='Moyennes'
+    )
+    average_count = fields.Integer(
+        string='Nombre de moyennes',
+        compute='_compute_average_count'
+    )
+
+    date_computed = fields.Datetime(
+        string='Dernier calcul',
+        readonly=True
+    )
+
+    _sql_constraints = [
+        ('name_unique', 'unique(name, academic_year_id)',
+         'Le nom de la période doit être unique pour une année scolaire!'),
+    ]
+
+    @api.depends('average_ids')
+    def _compute_average_count(self):
+        counts = {
+            period.id: count
+            for period, count in self.env['silina.period.average']._read_group(
+                [('period_id', 'in', self.ids)], ['period_id'], ['__count'])
+        }
+        for record in self:
+            record.average_count = counts.get(record.id, 0)
+
+    def action_load_exams(self):
+        """Ajouter les examens de l'année qui ne sont pas encore dans la période (poids 1)"""
+        self.ensure_one()
+        exams = self.env['silina.exam'].search([
+            ('academic_year_id', '=', self.academic_year_id.id),
+            ('state', '!=', 'cancelled'),
+            ('id', 'not in', self.exam_line_ids.exam_id.ids),
+        ])
+        self.write({'exam_line_ids': [(0, 0, {'exam_id': exam.id, 'weight': 1.0}) for exam in exams]})
+        return True
+
+    def action_compute(self):
+        for record in self:
+            record._compute_averages()
+        return True
+
+    def action_view_averages(self):
+        self.ensure_one()
+        return {
+            'name': _('Moyennes - %s') % self.name,
+            'type': 'ir.actions.act_window',
+            'res_model': 'silina.period.average',
+            'view_mode': 'list,form',
+            'domain': [('period_id', '=', self.id)],
+            'context': {'search_default_group_classroom': 1},
+        }
+
+    def _compute_averages(self):
+        """Calculer les moyennes pondérées et les rangs de la période en SQL
+
+        La moyenne de chaque examen est calculée par élève à partir des
+        résultats confirmés (somme des notes pondérées / somme des
+        coefficients), puis pondérée par le poids de l'examen dans la période.
+        Un examen sans résultat pour un élève n'entre pas dans sa moyenne.
+        Les lignes sont insérées ou mises à jour en une requête, puis classées
+        par classe avec une fonction de fenêtre.
+        """
+        self.ensure_one()
+        lines = self.exam_line_ids.filtered(lambda l: l.weight > 0)
+        if not lines:
+            raise ValidationError(_('Ajoutez au moins un examen avec un poids positif à la période!'))
+
+        self.env['silina.exam.result'].flush_model(['exam_id', 'student_id', 'state', 'weighted_marks', 'coefficient'])
+        self.env['silina.student'].flush_model(['classroom_id'])
+        Average = self.env['silina.period.average']
+        Average.flush_model()
+
+        self.env.cr.execute("""
+            WITH weights AS (
+                SELECT *
+                  FROM unnest(%(exam_ids)s::int[], %(weights)s::float8[]) AS w(exam_id, weight)
+            ), exam_averages AS (
+                SELECT result.student_id,
+                       result.exam_id,
+                       SUM(result.weighted_marks) / NULLIF(SUM(result.coefficient), 0) AS average
+                  FROM silina_exam_result result
+                 WHERE result.exam_id = ANY(%(exam_ids)s)
+                   AND result.state = 'confirmed'
+              GROUP BY result.student_id, result.exam_id
+            )
+            INSERT INTO silina_period_average
+                   (period_id, academic_year_id, student_id, classroom_id, average, total_weight, exam_count, is_passed,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT %(period_id)s,
+                   %(academic_year_id)s,
+                   exam_average.student_id,
+                   student.classroom_id,
+                   SUM(exam_average.average * weights.weight) / SUM(weights.weight),
+                   SUM(weights.weight),
+                   COUNT(*),
+                   SUM(exam_average.average * weights.weight) / SUM(weights.weight) >= %(passing)s,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM exam_averages exam_average
+              JOIN weights ON weights.exam_id = exam_average.exam_id
+              JOIN silina_student student ON student.id = exam_average.student_id
+             WHERE exam_average.average IS NOT NULL
+          GROUP BY exam_average.student_id, student.classroom_id
+            ON CONFLICT (period_id, student_id) DO UPDATE
+               SET academic_year_id = EXCLUDED.academic_year_id,
+                   classroom_id = EXCLUDED.classroom_id,
+                   average = EXCLUDED.average,
+                   total_weight = EXCLUDED.total_weight,
+                   exam_count = EXCLUDED.exam_count,
+                   is_passed = EXCLUDED.is_passed,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+         RETURNING id
+        """, {
+            'period_id': self.id,
+            'academic_year_id': self.academic_year_id.id,
+            'exam_ids': lines.exam_id.ids,
+            'weights': lines.mapped('weight'),
+            'passing': self.passing_average,
+            'uid': self.env.uid,
+        })
+        average_ids = [row[0] for row in self.env.cr.fetchall()]
+
+        # Élèves qui n'ont plus de résultat dans la période
+        self.env.cr.execute("""
+            DELETE FROM silina_period_average
+             WHERE period_id = %s
+               AND NOT (id = ANY(%s))
+        """, [self.id, average_ids])
+
+        self.env.cr.execute("""
+            UPDATE silina_period_average target
+               SET rank = ranked.rank
+              FROM (
+                    SELECT id, RANK() OVER (PARTITION BY classroom_id ORDER BY average DESC NULLS LAST) AS rank
+                      FROM silina_period_average
+                     WHERE period_id = %s
+                   ) ranked
+             WHERE target.id = ranked.id
+        """, [self.id])
+
+        Average.invalidate_model()
+        self.invalidate_recordset(['average_ids', 'average_count'])
+        self.date_computed = fields.Datetime.now()
+
+
+class GradingPeriodExam(models.Model):
+    _name = 'silina.grading.period.exam'
+    _description = 'Examen d\'une Période d\'Évaluation'
+    _order = 'period_id, sequence, id'
+
+    period_id = fields.Many2one(
+        'silina.grading.period',
+        string='Période',
+        required=True,
+        ondelete='cascade'
+    )
+    sequence = fields.Integer(string='Séquence', default=10)
+    exam_id = fields.Many2one(
+        'silina.exam',
+        string='Examen',
+        required=True,
+        ondelete='cascade'
+    )
+    weight = fields.Float(
+        string='Poids',
+        default=1.0,
+        required=True,
+        help="Poids de l'examen dans la moyenne de la période"
+    )
+
+    _sql_constraints = [
+        ('exam_unique', 'unique(period_id, exam_id)',
+         'Un examen ne peut figurer qu\'une fois dans une période!'),
+    ]
+
+    @api.constrains('weight')
+    def _check_weight(self):
+        for record in self:
+            if record.weight < 0:
+                raise ValidationError(_('Le poids d\'un examen ne peut pas être négatif!'))
+
+
+class PeriodAverage(models.Model):
+    """Moyenne pondérée d'un élève sur une période (une ligne par élève, calculée en SQL)"""
+    _name = 'silina.period.average'
+    _description = 'Moyenne de Période'
+    _order = 'period_id, classroom_id, rank'
+    _rec_name = 'student_id'
+
+    period_id = fields.Many2one(
+        'silina.grading.period',
+        string='Période',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    academic_year_id = fields.Many2one(
+        related='period_id.academic_year_id',
+        string='Année Scolaire',
+        store=True
+    )
+    student_id = fields.Many2one(
+        'silina.student',
+        string='Élève',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    classroom_id = fields.Many2one(
+        'silina.classroom',
+        string='Classe',
+        readonly=True,
+        index=True
+    )
+
+    average = fields.Float(string='Moyenne', readonly=True)
+    total_weight = fields.Float(string='Poids total', readonly=True)
+    exam_count = fields.Integer(string='Examens', readonly=True)
+    rank = fields.Integer(string='Rang', readonly=True, help="Rang de l'élève dans sa classe")
+    is_passed = fields.Boolean(string='Admis', readonly=True)
+
+    _sql_constraints = [
+        ('period_student_unique', 'unique(period_id, student_id)',
+         'Une seule moyenne par élève et par période!'),
+    ]
@@ -9,6 +9,9 @@ class Student(models.Model):
     _order = 'name'
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
+    # Clé des élèves dont les bulletins mis en cache sont à invalider dans la transaction courante
+    _REPORT_CARD_PRECOMMIT_KEY = 'silina.student.report_card'
+
     # Informations de base
     name = fields.Char(
         string='Nom complet',
@@ -171,6 +174,11 @@ class Student(models.Model):
     )
 
     # Frais scolaires (gérés via factures account.move)
+    fee_ledger_ids = fields.One2many(
+        'silina.student.fee.ledger',
+        'student_id',
+        string='Soldes des frais'
+    )
     currency_id = fields.Many2one(
         'res.currency',
         string='Devise',
@@ -195,9 +203,16 @@ class Student(models.Model):
     notes = fields.Text(string='Notes')
     active = fields.Boolean(default=True)
 
+    report_card_version = fields.Char(
+        string='Version du bulletin',
+        readonly=True,
+        copy=False,
+        help="Change à chaque modification des notes de l'élève : fait partie du nom des bulletins mis en cache"
+    )
+
     _sql_constraints = [
-        ('registration_number_unique', 'unique(registration_number)',
-         'Le numéro de matricule doit être unique!'),
+        ('registration_number_unique', 'unique(registration_number, academic_year_id)',
+         'Le numéro de matricule doit être unique pour une année scolaire!'),
     ]
 
     @api.onchange('name')
@@ -277,38 +292,44 @@ class Student(models.Model):
                     'silina.student'
                 ) or _('Nouveau')
 
-            # Formater le nom (tous les mots en MAJUSCULES)
-            if vals.get('last_name'):
-                vals['last_name'] = ' '.join([word.upper() for word in vals['last_name'].split()])
+            self._format_name_vals(vals)
+
+        students = super().create(vals_list)
+        # Créer automatiquement les contacts partner, en une fois pour tout le lot,
+        # sauf si leur création est différée jusqu'à la première facture
+        if not self._defer_partner_creation():
+            students.filtered(lambda s: not s.partner_id)._create_partners()
+        return students
 
-            # Formater le prénom (tous les mots en Capitalize)
-            if vals.get('first_name'):
-                vals['first_name'] = ' '.join([word.capitalize() for word in vals['first_name'].split()])
+    @api.model
+    def _format_name_vals(self, vals):
+        """Normaliser nom, prénom et nom complet d'un dictionnaire de valeurs (modifié sur place)"""
+        # Formater le nom (tous les mots en MAJUSCULES)
+        if vals.get('last_name'):
+            vals['last_name'] = ' '.join([word.upper() for word in vals['last_name'].split()])
 
-            # Logique de division du nom complet
-            if vals.get('name') and not (vals.get('first_name') or vals.get('last_name')):
-                parts = vals['name'].strip().split()
-                if len(parts) >= 1:
-                    vals['last_name'] = parts[0].upper()
-                    if len(parts) > 1:
-                        prenom_parts = parts[1:]
-                        vals['first_name'] = ' '.join([word.capitalize() for word in prenom_parts])
+        # Formater le prénom (tous les mots en Capitalize)
+        if vals.get('first_name'):
+            vals['first_name'] = ' '.join([word.capitalize() for word in vals['first_name'].split()])
 
-            # Mise à jour du nom complet si prénom/nom fournis
-            if vals.get('first_name') and vals.get('last_name'):
-                # Nom complet = NOM + Prénom (Nom toujours en premier)
-                vals['name'] = f"{vals['last_name']} {vals['first_name']}"
-            elif vals.get('last_name'):
-                vals['name'] = vals['last_name']
-            elif vals.get('first_name'):
-                vals['name'] = vals['first_name']
+        # Logique de division du nom complet
+        if vals.get('name') and not (vals.get('first_name') or vals.get('last_name')):
+            parts = vals['name'].strip().split()
+            if len(parts) >= 1:
+                vals['last_name'] = parts[0].upper()
+                if len(parts) > 1:
+                    prenom_parts = parts[1:]
+                    vals['first_name'] = ' '.join([word.capitalize() for word in prenom_parts])
 
-        students = super().create(vals_list)
-        # Créer automatiquement le contact partner pour chaque élève
-        for student in students:
-            if not student.partner_id:
-                student._create_partner()
-        return students
+        # Mise à jour du nom complet si prénom/nom fournis
+        if vals.get('first_name') and vals.get('last_name'):
+            # Nom complet = NOM + Prénom (Nom toujours en premier)
+            vals['name'] = f"{vals['last_name']} {vals['first_name']}"
+        elif vals.get('last_name'):
+            vals['name'] = vals['last_name']
+        elif vals.get('first_name'):
+            vals['name'] = vals['first_name']
+        return vals
 
     def write(self, vals):
         # Formater le nom (tous les mots en MAJUSCULES)
@@ -341,7 +362,17 @@ class Student(models.Model):
                 elif first_name:
                     vals['name'] = first_name
 
-        return super().write(vals)
+        # Changement de classe : les statistiques de l'ancienne et de la nouvelle classe changent
+        results = self.env['silina.exam.result']
+        statistics_keys = set()
+        if 'classroom_id' in vals:
+            results = self.exam_result_ids
+            statistics_keys = results._get_statistics_keys()
+
+        res = super().write(vals)
+        if results:
+            self.env['silina.exam.statistics']._mark_dirty(statistics_keys | results._get_statistics_keys())
+        return res
 
     def action_enroll(self):
         self.ensure_one()
@@ -371,12 +402,94 @@ class Student(models.Model):
             'context': {'default_student_ids': [(6, 0, self.ids)]}
         }
 
+    def _get_report_card_attachment_name(self, template_type):
+        """Nom du bulletin mis en cache (utilisé par l'attribut attachment des rapports)"""
+        self.ensure_one()
+        return self.env['report.silina_edu.report_card_standard_document']._get_report_card_attachment_name(
+            self, template_type)
+
+    def _invalidate_report_card_cache(self):
+        """Planifier, en fin de transaction, l'invalidation des bulletins mis en cache de ces élèves
+
+        Les élèves sont accumulés pour n'invalider leurs bulletins qu'une
+        fois par transaction, quel que soit le nombre de notes modifiées.
+        """
+        student_ids = set(self.ids)
+        if not student_ids:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get(self._REPORT_CARD_PRECOMMIT_KEY)
+        if pending is None:
+            pending = data[self._REPORT_CARD_PRECOMMIT_KEY] = set()
+            self.env.cr.precommit.add(self._flush_report_card_cache)
+        pending.update(student_ids)
+
+    @api.model
+    def _flush_report_card_cache(self):
+        """Changer la version des bulletins des élèves en attente et supprimer leurs bulletins mis en cache"""
+        student_ids = list(self.env.cr.precommit.data.pop(self._REPORT_CARD_PRECOMMIT_KEY, set()))
+        if not student_ids:
+            return
+        self.flush_model(['report_card_version'])
+        self.env.cr.execute("""
+            UPDATE silina_student
+               SET report_card_version = md5(random()::text || clock_timestamp()::text)
+             WHERE id = ANY(%s)
+        """, [student_ids])
+        self.invalidate_model(['report_card_version'])
+        self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', student_ids),
+            ('name', '=like', 'Bulletin-%.pdf'),
+        ]).unlink()
+
+    @api.model
+    def _defer_partner_creation(self):
+        """Différer la création des contacts jusqu'à la première facture
+
+        Activé par le contexte ``defer_student_partner`` ou par le paramètre
+        système ``silina_edu.defer_student_partner``.
+        """
+        if 'defer_student_partner' in self.env.context:
+            return bool(self.env.context['defer_student_partner'])
+        param = self.env['ir.config_parameter'].sudo().get_param('silina_edu.defer_student_partner')
+        return str(param).lower() in ('1', 'true', 'yes')
+
     def _create_partner(self):
         """Créer un contact res.partner pour l'élève"""
         self.ensure_one()
-        if self.partner_id:
-            return self.partner_id
-
+        self._create_partners()
+        return self.partner_id
+
+    def _create_partners(self):
+        """Créer les contacts res.partner des élèves qui n'en ont pas
+
+        Tous les contacts sont créés en un seul ``create(vals_list)`` puis
+        liés aux élèves par une seule requête UPDATE.
+        """
+        students = self.filtered(lambda s: not s.partner_id)
+        if not students:
+            return self.env['res.partner']
+
+        vals_list = [student._prepare_partner_vals() for student in students]
+        partners = self.env['res.partner'].sudo().create(vals_list)
+
+        students.flush_recordset(['partner_id'])
+        self.env.cr.execute("""
+            UPDATE silina_student student
+               SET partner_id = link.partner_id,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::int[]) AS link(student_id, partner_id)
+             WHERE student.id = link.student_id
+        """, [self.env.uid, students.ids, partners.ids])
+        students.invalidate_recordset(['partner_id', 'write_uid', 'write_date'])
+        students.modified(['partner_id'])
+        return partners
+
+    def _prepare_partner_vals(self):
+        """Valeurs du contact res.partner de l'élève"""
+        self.ensure_one()
         # Trouver le contact du parent responsable financier pour le lier
         parent_partner = False
         for parent in self.parent_ids:
@@ -403,7 +516,4 @@ class Student(models.Model):
         # Si un parent responsable financier existe, le lier comme contact parent
         if parent_partner:
             partner_vals['parent_id'] = parent_partner.id
-
-        partner = self.env['res.partner'].sudo().create(partner_vals)
-        self.partner_id = partner.id
-        return partner
+        return partner_vals
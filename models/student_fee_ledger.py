@@ -0,0 +1,219 @@
+from odoo import models, fields, api, _
+from odoo.tools import sql
+
+
+class StudentFeeLedger(models.Model):
+    """Soldes des frais scolaires par élève, type de frais et tranche
+
+    Modèle de lecture maintenu en SQL à partir des factures de frais
+    validées : les lignes d'un élève sont recalculées en fin de transaction
+    lorsqu'une de ses factures est validée, annulée, remise en brouillon ou
+    lettrée (voir ``account_move.py``). Le montant payé d'une facture est
+    réparti sur ses tranches dans l'ordre des tranches.
+    """
+    _name = 'silina.student.fee.ledger'
+    _description = 'Solde des Frais Scolaires par Élève'
+    _order = 'student_id, fee_type_id, due_date, id'
+    _rec_name = 'fee_type_id'
+
+    # Clé des élèves à recalculer dans la transaction courante
+    _PRECOMMIT_KEY = 'silina.student.fee.ledger.students'
+
+    student_id = fields.Many2one(
+        'silina.student',
+        string='Élève',
+        required=True,
+        ondelete='cascade',
+        index=True,
+        readonly=True
+    )
+    academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année Scolaire',
+        index=True,
+        readonly=True
+    )
+    fee_type_id = fields.Many2one(
+        'silina.fee.type',
+        string='Type de frais',
+        readonly=True
+    )
+    installment_id = fields.Many2one(
+        'silina.fee.type.installment',
+        string='Tranche',
+        readonly=True
+    )
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Devise',
+        readonly=True
+    )
+    amount_invoiced = fields.Monetary(
+        string='Montant facturé',
+        currency_field='currency_id',
+        readonly=True
+    )
+    amount_paid = fields.Monetary(
+        string='Montant payé',
+        currency_field='currency_id',
+        readonly=True
+    )
+    amount_residual = fields.Monetary(
+        string='Reste à payer',
+        currency_field='currency_id',
+        readonly=True
+    )
+
+    due_date = fields.Date(string='Échéance', readonly=True)
+    invoice_count = fields.Integer(string='Factures', readonly=True)
+
+    state = fields.Selection([
+        ('open', 'Non payé'),
+        ('partial', 'Partiellement payé'),
+        ('paid', 'Payé'),
+    ], string='État', readonly=True)
+
+    def init(self):
+        # Recherche des tranches en retard (relances) : échéances restant dues uniquement
+        sql.create_index(
+            self.env.cr, 'silina_student_fee_ledger_overdue_index', self._table,
+            ['due_date'], where='amount_residual > 0',
+        )
+
+    @api.model
+    def _refresh_students(self, student_ids):
+        """Recalculer en SQL les soldes des élèves donnés à partir de leurs factures validées
+
+        :return: ids des années scolaires dont les soldes ont changé
+        """
+        student_ids = list(set(student_ids))
+        if not student_ids:
+            return set()
+        self.env['account.move'].flush_model([
+            'move_type', 'state', 'currency_id', 'amount_total', 'amount_residual', 'invoice_date_due',
+            'silina_student_id', 'silina_fee_type_id', 'silina_academic_year_id',
+        ])
+        self.env['account.move.line'].flush_model(['move_id', 'display_type', 'price_total', 'silina_installment_id'])
+        self.env['silina.fee.type.installment'].flush_model(['sequence', 'due_date_type', 'due_date'])
+        self.flush_model()
+
+        self.env.cr.execute("""
+            DELETE FROM silina_student_fee_ledger
+             WHERE student_id = ANY(%s)
+         RETURNING academic_year_id
+        """, [student_ids])
+        academic_year_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        self.env.cr.execute("""
+            WITH lines AS (
+                SELECT move.silina_student_id AS student_id,
+                       move.silina_academic_year_id AS academic_year_id,
+                       move.silina_fee_type_id AS fee_type_id,
+                       line.silina_installment_id AS installment_id,
+                       move.currency_id,
+                       move.id AS move_id,
+                       line.price_total,
+                       move.amount_total - move.amount_residual AS move_paid,
+                       SUM(line.price_total) OVER (
+                           PARTITION BY move.id
+                           ORDER BY installment.sequence NULLS LAST, line.id
+                           ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                       ) - line.price_total AS paid_before,
+                       CASE WHEN installment.due_date_type = 'fixed' AND installment.due_date IS NOT NULL
+                            THEN installment.due_date
+                            ELSE move.invoice_date_due
+                       END AS due_date
+                  FROM account_move move
+                  JOIN account_move_line line ON line.move_id = move.id AND line.display_type = 'product'
+             LEFT JOIN silina_fee_type_installment installment ON installment.id = line.silina_installment_id
+                 WHERE move.silina_student_id = ANY(%(student_ids)s)
+                   AND move.move_type = 'out_invoice'
+                   AND move.state = 'posted'
+            ), allocated AS (
+                SELECT *, LEAST(price_total, GREATEST(move_paid - paid_before, 0)) AS paid
+                  FROM lines
+            )
+            INSERT INTO silina_student_fee_ledger
+                   (student_id, academic_year_id, fee_type_id, installment_id, currency_id,
+                    amount_invoiced, amount_paid, amount_residual, due_date, invoice_count, state,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT student_id, academic_year_id, fee_type_id, installment_id, currency_id,
+                   SUM(price_total),
+                   SUM(paid),
+                   SUM(price_total) - SUM(paid),
+                   MIN(due_date),
+                   COUNT(DISTINCT move_id),
+                   CASE WHEN SUM(price_total) - SUM(paid) <= 0 THEN 'paid'
+                        WHEN SUM(paid) > 0 THEN 'partial'
+                        ELSE 'open'
+                   END,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM allocated
+          GROUP BY student_id, academic_year_id, fee_type_id, installment_id, currency_id
+         RETURNING academic_year_id
+        """, {'student_ids': student_ids, 'uid': self.env.uid})
+        academic_year_ids.update(row[0] for row in self.env.cr.fetchall())
+        self.invalidate_model()
+        return academic_year_ids - {None}
+
+    @api.model
+    def _mark_dirty(self, student_ids):
+        """Planifier, en fin de transaction, le recalcul des soldes de ces élèves
+
+        Les élèves sont accumulés pour ne recalculer chacun qu'une fois par
+        transaction, quel que soit le nombre de factures ou de lettrages.
+        """
+        student_ids = {student_id for student_id in student_ids if student_id}
+        if not student_ids:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.get(self._PRECOMMIT_KEY)
+        if pending is None:
+            pending = data[self._PRECOMMIT_KEY] = set()
+            self.env.cr.precommit.add(self._refresh_dirty)
+        pending.update(student_ids)
+
+    @api.model
+    def _refresh_dirty(self):
+        student_ids = self.env.cr.precommit.data.pop(self._PRECOMMIT_KEY, set())
+        academic_year_ids = self.sudo()._refresh_students(student_ids)
+        self.env['silina.financial.snapshot']._mark_dirty(academic_year_ids)
+
+    @api.model
+    def _get_balances(self, students, fee_types=None):
+        """Soldes agrégés par élève, année scolaire et type de frais, en une requête groupée
+
+        Les recalculs en attente dans la transaction sont appliqués avant la
+        lecture.
+
+        :return: dict {(student_id, academic_year_id, fee_type_id): {'amount_invoiced', 'amount_paid', 'amount_residual'}}
+        """
+        self._refresh_dirty()
+        domain = [('student_id', 'in', students.ids)]
+        if fee_types is not None:
+            domain.append(('fee_type_id', 'in', fee_types.ids))
+        return {
+            (student.id, academic_year.id, fee_type.id): {
+                'amount_invoiced': invoiced,
+                'amount_paid': paid,
+                'amount_residual': residual,
+            }
+            for student, academic_year, fee_type, invoiced, paid, residual in self._read_group(
+                domain, ['student_id', 'academic_year_id', 'fee_type_id'],
+                ['amount_invoiced:sum', 'amount_paid:sum', 'amount_residual:sum'])
+        }
+
+    def action_view_invoices(self):
+        self.ensure_one()
+        return {
+            'name': _('Factures - %s') % self.student_id.name,
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move',
+            'view_mode': 'list,form',
+            'domain': [
+                ('silina_student_id', '=', self.student_id.id),
+                ('silina_fee_type_id', '=', self.fee_type_id.id),
+                ('move_type', '=', 'out_invoice'),
+            ],
+        }
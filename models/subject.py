@@ -52,6 +52,13 @@ class Subject(models.Model):
         ('code_unique', 'unique(code)', 'Le code de la matière doit être unique!'),
     ]
 
+    def write(self, vals):
+        res = super().write(vals)
+        if 'coefficient' in vals:
+            # Le coefficient modifie les notes pondérées des résultats
+            self.env['silina.exam.result']._bulk_recompute(subject_ids=self.ids)
+        return res
+
     @api.depends('name', 'code')
     def name_get(self):
         result = []
@@ -0,0 +1,3 @@
+from . import report_card
+from . import fee_dunning
+from . import payment_receipt
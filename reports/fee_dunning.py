@@ -0,0 +1,18 @@
+from odoo import models, api
+
+
+class ReportFeeDunning(models.AbstractModel):
+    """Lettres de relance : une page par parent, données regroupées en une requête"""
+    _name = 'report.silina_edu.report_fee_dunning_document'
+    _description = 'Lettres de Relance des Frais Impayés'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        dunnings = self.env['silina.fee.dunning'].browse(docids)
+        return {
+            'doc_ids': docids,
+            'doc_model': 'silina.fee.dunning',
+            'docs': dunnings,
+            'data': data,
+            'letter_groups': {dunning.id: dunning._get_letter_groups() for dunning in dunnings},
+        }
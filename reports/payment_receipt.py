@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from odoo import models, api
+
+
+class ReportPaymentReceipt(models.AbstractModel):
+    """Fournisseur de données des reçus de paiement thermiques
+
+    Les factures lettrées, les élèves, les lignes de factures et les soldes
+    de tous les paiements du lot sont chargés en quelques requêtes groupées ;
+    le modèle QWeb ne fait que lire le dictionnaire ``receipts``.
+    """
+    _name = 'report.silina_edu.report_payment_receipt_document'
+    _description = 'Reçu de Paiement Thermique'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        payments = self.env['account.payment'].browse(docids)
+        return {
+            'doc_ids': docids,
+            'doc_model': 'account.payment',
+            'docs': payments,
+            'data': data,
+            'receipts': self._get_receipt_data(payments),
+        }
+
+    @api.model
+    def _get_receipt_data(self, payments):
+        """Précharger les données des reçus pour tout le lot
+
+        :return: dict {payment_id: {'invoice', 'student', 'balance', 'lines', 'paid_line', 'is_partial'}}
+        """
+        # Factures lettrées de tous les paiements (calcul groupé sur le lot)
+        invoice_by_payment = {
+            payment.id: payment.reconciled_invoice_ids[:1]
+            for payment in payments
+        }
+        invoices = self.env['account.move'].union(*invoice_by_payment.values())
+        invoices.fetch(['name', 'invoice_date', 'invoice_date_due', 'amount_total', 'currency_id',
+                        'silina_student_id', 'silina_fee_type_id', 'silina_academic_year_id', 'invoice_line_ids'])
+
+        # Lignes de toutes les factures, en une requête
+        lines_by_invoice = defaultdict(lambda: self.env['account.move.line'])
+        for line in invoices.invoice_line_ids:
+            lines_by_invoice[line.move_id.id] |= line
+
+        # Élèves : lien indexé de la facture, sinon une seule recherche par contact
+        student_by_partner = {}
+        missing_partner_ids = {
+            payment.partner_id.id
+            for payment in payments
+            if not invoice_by_payment[payment.id].silina_student_id
+        } - {False}
+        if missing_partner_ids:
+            for student in self.env['silina.student'].search(
+                    [('partner_id', 'in', list(missing_partner_ids))], order='id desc'):
+                student_by_partner.setdefault(student.partner_id.id, student)
+        students = invoices.silina_student_id.union(*student_by_partner.values())
+        students.fetch(['name', 'registration_number', 'classroom_id', 'academic_year_id'])
+
+        # Soldes précalculés des élèves par année scolaire et type de frais, en une requête groupée
+        balances = self.env['silina.student.fee.ledger']._get_balances(students, invoices.silina_fee_type_id)
+
+        receipts = {}
+        for payment in payments:
+            invoice = invoice_by_payment[payment.id]
+            student = invoice.silina_student_id or student_by_partner.get(payment.partner_id.id) \
+                or self.env['silina.student']
+            lines = lines_by_invoice[invoice.id]
+            is_partial = bool(invoice) and payment.currency_id.compare_amounts(payment.amount, invoice.amount_total) < 0
+            paid_line = lines.browse()
+            if is_partial:
+                # Tranche correspondant au montant payé
+                paid_line = next(
+                    (line for line in lines if abs(line.price_subtotal - payment.amount) < 0.01),
+                    lines.browse(),
+                )
+            receipts[payment.id] = {
+                'invoice': invoice,
+                'student': student,
+                'balance': balances.get(
+                    (student.id, invoice.silina_academic_year_id.id, invoice.silina_fee_type_id.id)
+                ) if student and invoice else False,
+                'lines': paid_line + (lines - paid_line),
+                'paid_line': paid_line,
+                'is_partial': is_partial,
+            }
+        return receipts
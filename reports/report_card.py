@@ -0,0 +1,171 @@
+import hashlib
+from collections import defaultdict
+
+from odoo import models, api, _
+
+
+class ReportCardStandard(models.AbstractModel):
+    """Fournisseur de données des bulletins de notes
+
+    Les résultats, résumés et effectifs de classe de tous les élèves du lot
+    sont chargés en quelques requêtes groupées ; les modèles QWeb ne
+    reçoivent que des dictionnaires et n'exécutent aucune requête.
+    """
+    _name = 'report.silina_edu.report_card_standard_document'
+    _description = 'Bulletin de Notes (Standard)'
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        students = self.env['silina.student'].browse(docids)
+        return {
+            'doc_ids': docids,
+            'doc_model': 'silina.student',
+            'docs': students,
+            'data': data,
+            'report_data': self._get_report_card_data(students),
+        }
+
+    @api.model
+    def _get_report_exams(self, students):
+        """Examens à imprimer : celui du contexte, sinon ceux de l'année ayant des résultats confirmés"""
+        exam_id = self.env.context.get('exam_id')
+        if exam_id:
+            return self.env['silina.exam'].browse(exam_id)
+
+        academic_year_ids = [self.env.context['academic_year_id']] if self.env.context.get('academic_year_id') \
+            else students.academic_year_id.ids
+        groups = self.env['silina.exam.result']._read_group([
+            ('student_id', 'in', students.ids),
+            ('academic_year_id', 'in', academic_year_ids),
+            ('state', '=', 'confirmed'),
+        ], ['exam_id'])
+        return self.env['silina.exam'].browse([exam.id for exam, in groups]).sorted(
+            lambda e: (e.date_start, e.id)
+        )
+
+    @api.model
+    def _get_report_card_data(self, students):
+        """Précharger les données des bulletins pour tout le lot
+
+        :return: dict {student_id: [{'exam': {...}, 'results': [...], 'summary': {...}, 'class_size': n}]}
+        """
+        exams = self._get_report_exams(students)
+        if not students or not exams:
+            return {student_id: [] for student_id in students.ids}
+
+        exam_info = {
+            exam['id']: exam
+            for exam in exams.read(['name', 'exam_type', 'total_marks', 'passing_marks', 'date_start'])
+        }
+
+        # Résultats confirmés de tous les élèves, en une requête
+        results = defaultdict(list)
+        for result in self.env['silina.exam.result'].search_read([
+            ('exam_id', 'in', exams.ids),
+            ('student_id', 'in', students.ids),
+            ('state', '=', 'confirmed'),
+        ], ['exam_id', 'student_id', 'subject_id', 'coefficient', 'marks_obtained',
+            'total_marks', 'percentage', 'grade', 'is_passed', 'remarks']):
+            results[(result['exam_id'][0], result['student_id'][0])].append({
+                'subject_id': result['subject_id'][0] if result['subject_id'] else False,
+                'subject': result['subject_id'][1] if result['subject_id'] else '',
+                'coefficient': result['coefficient'],
+                'marks_obtained': result['marks_obtained'],
+                'total_marks': result['total_marks'],
+                'percentage': result['percentage'],
+                'grade': result['grade'] or '',
+                'is_passed': result['is_passed'],
+                'remarks': result['remarks'] or '',
+            })
+
+        # Résumés de tous les élèves, en une requête
+        summaries = {}
+        for summary in self.env['silina.exam.result.summary'].search_read([
+            ('exam_id', 'in', exams.ids),
+            ('student_id', 'in', students.ids),
+        ], ['exam_id', 'student_id', 'classroom_id', 'average', 'percentage', 'grade',
+            'is_passed', 'rank', 'total_coefficients', 'total_weighted_marks'], load=None):
+            summaries[(summary['exam_id'], summary['student_id'])] = summary
+
+        # Effectifs par examen et par classe, en une requête groupée
+        class_sizes = {
+            (exam.id, classroom.id): count
+            for exam, classroom, count in self.env['silina.exam.result.summary']._read_group([
+                ('exam_id', 'in', exams.ids),
+                ('classroom_id', 'in', students.classroom_id.ids),
+            ], ['exam_id', 'classroom_id'], ['__count'])
+        }
+
+        # Statistiques de classe précalculées, en une requête
+        statistics = {}
+        if self.env.context.get('include_statistics'):
+            for stat in self.env['silina.exam.statistics'].search_read([
+                ('exam_id', 'in', exams.ids),
+                ('classroom_id', 'in', students.classroom_id.ids),
+            ], ['exam_id', 'classroom_id', 'subject_id', 'mean', 'min_marks', 'max_marks', 'median',
+                'pass_rate'], load=None):
+                statistics[(stat['exam_id'], stat['classroom_id'], stat['subject_id'])] = stat
+
+        report_data = {}
+        for student in students:
+            blocks = []
+            for exam_id in exams.ids:
+                student_results = results.get((exam_id, student.id))
+                summary = summaries.get((exam_id, student.id))
+                if not student_results and not summary:
+                    continue
+                if statistics:
+                    student_results = [
+                        dict(result, statistics=statistics.get((exam_id, student.classroom_id.id, result['subject_id'])))
+                        for result in student_results or []
+                    ]
+                blocks.append({
+                    'exam': exam_info[exam_id],
+                    'results': student_results or [],
+                    'summary': summary,
+                    'class_size': class_sizes.get((exam_id, student.classroom_id.id), 0),
+                })
+            report_data[student.id] = blocks
+        return report_data
+
+    @api.model
+    def _get_report_card_cache_key(self, template_type):
+        """Clé des options d'impression : modèle, langue, options et examen/année"""
+        context = self.env.context
+        return '|'.join(str(value) for value in (
+            template_type,
+            context.get('lang'),
+            context.get('exam_id') or '',
+            context.get('academic_year_id') or '',
+            bool(context.get('include_rank')),
+            bool(context.get('include_statistics')),
+            context.get('include_comments', True),
+        ))
+
+    @api.model
+    def _get_report_card_attachment_name(self, student, template_type):
+        """Nom de la pièce jointe mise en cache pour ce bulletin
+
+        Le nom contient un condensé des options et de la version du bulletin
+        de l'élève, changée à chaque modification de ses notes, résumés ou
+        statistiques de classe : un bulletin n'est resservi que si rien n'a
+        changé depuis son rendu.
+        """
+        # Appliquer les invalidations en attente dans la transaction (notes modifiées puis imprimées)
+        self.env['silina.exam.statistics']._refresh_dirty()
+        student._flush_report_card_cache()
+        key = self._get_report_card_cache_key(template_type)
+        digest = hashlib.sha1(f"{key}#{student.report_card_version}".encode()).hexdigest()[:16]
+        return f"Bulletin-{student.registration_number}-{digest}.pdf"
+
+
+class ReportCardModern(models.AbstractModel):
+    _name = 'report.silina_edu.report_card_modern_document'
+    _inherit = 'report.silina_edu.report_card_standard_document'
+    _description = 'Bulletin de Notes (Moderne)'
+
+
+class ReportCardDetailed(models.AbstractModel):
+    _name = 'report.silina_edu.report_card_detailed_document'
+    _inherit = 'report.silina_edu.report_card_standard_document'
+    _description = 'Bulletin de Notes (Détaillé)'
@@ -2,3 +2,5 @@ from . import bulk_student_promotion
 from . import generate_report_card
 from . import generate_fee_invoices
 from . import student_fee_payment
+from . import student_import
+from . import fee_batch_payment
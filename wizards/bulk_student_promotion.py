@@ -1,11 +1,19 @@
+import logging
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
 
 
 class BulkStudentPromotion(models.TransientModel):
     _name = 'silina.bulk.student.promotion.wizard'
     _description = 'Assistant de Passage en Masse des Élèves'
 
+    # Nombre d'élèves créés par lot lors de la promotion
+    _promotion_batch_size = 200
+
     current_academic_year_id = fields.Many2one(
         'silina.academic.year',
         string='Année scolaire actuelle',
@@ -68,6 +76,19 @@ class BulkStudentPromotion(models.TransientModel):
         required=True
     )
 
+    grading_period_id = fields.Many2one(
+        'silina.grading.period',
+        string='Période de référence',
+        domain="[('academic_year_id', '=', current_academic_year_id)]",
+        help="Si renseignée, les élèves admis sont ceux dont la moyenne de cette période atteint la moyenne de passage"
+    )
+
+    balance_gender = fields.Boolean(
+        string='Équilibrer filles/garçons',
+        default=False,
+        help="Répartir les élèves de façon à équilibrer filles et garçons entre les sections d'un même niveau"
+    )
+
     notes = fields.Text(string='Notes')
 
     @api.depends('student_ids', 'line_ids')
@@ -78,7 +99,7 @@ class BulkStudentPromotion(models.TransientModel):
             else:
                 record.student_count = len(record.student_ids)
 
-    @api.onchange('current_classroom_ids', 'promotion_type')
+    @api.onchange('current_classroom_ids', 'promotion_type', 'grading_period_id')
     def _onchange_classrooms(self):
         """Charger automatiquement les élèves selon le type de promotion"""
         if not self.current_classroom_ids:
@@ -87,7 +108,24 @@ class BulkStudentPromotion(models.TransientModel):
 
         domain = [('classroom_id', 'in', self.current_classroom_ids.ids)]
 
-        if self.promotion_type == 'passed':
+        warning = False
+        if self.promotion_type == 'passed' and self.grading_period_id:
+            if not self.grading_period_id.date_computed:
+                warning = {
+                    'title': _('Moyennes non calculées'),
+                    'message': _('Les moyennes de la période %s n\'ont pas encore été calculées : '
+                                 'aucun élève admis ne peut être sélectionné. Utilisez "Calculer les '
+                                 'moyennes" sur la période.') % self.grading_period_id.name,
+                }
+            # Décision lue sur les moyennes précalculées de la période, pour les élèves
+            # actuellement dans ces classes (la classe des moyennes est celle du dernier calcul)
+            passed = self.env['silina.period.average'].search_read([
+                ('period_id', '=', self.grading_period_id.id),
+                ('student_id', 'in', self.env['silina.student'].search(domain).ids),
+                ('is_passed', '=', True),
+            ], ['student_id'], load=None)
+            domain.append(('id', 'in', [average['student_id'] for average in passed]))
+        elif self.promotion_type == 'passed':
             domain.append(('state', '=', 'promoted'))
         elif self.promotion_type == 'all':
             domain.append(('state', 'in', ['enrolled', 'promoted']))
@@ -95,6 +133,8 @@ class BulkStudentPromotion(models.TransientModel):
         if self.promotion_type != 'manual':
             students = self.env['silina.student'].search(domain)
             self.student_ids = students
+        if warning:
+            return {'warning': warning}
 
     def action_preview(self):
         """Générer un aperçu des promotions"""
@@ -107,25 +147,19 @@ class BulkStudentPromotion(models.TransientModel):
         self.line_ids.unlink()
         lines = []
 
-        for student in self.student_ids:
-            # Trouver le niveau suivant
-            next_level = student.level_id.next_level_id
-            if not next_level:
-                continue
-
-            # Trouver une classe disponible dans le nouveau niveau
-            new_classroom = self.env['silina.classroom'].search([
-                ('level_id', '=', next_level.id),
-                ('academic_year_id', '=', self.new_academic_year_id.id)
-            ], limit=1)
+        students = self.student_ids.filtered(lambda s: s.level_id.next_level_id).sorted(
+            lambda s: (s.level_id.id, s.name or '')
+        )
+        assignments = self._assign_classrooms(students)
 
+        for student in students:
             lines.append({
                 'wizard_id': self.id,
                 'student_id': student.id,
                 'current_classroom_id': student.classroom_id.id,
                 'current_level_id': student.level_id.id,
-                'new_level_id': next_level.id,
-                'new_classroom_id': new_classroom.id if new_classroom else False,
+                'new_level_id': student.level_id.next_level_id.id,
+                'new_classroom_id': assignments.get(student.id, False),
             })
 
         if lines:
@@ -142,6 +176,62 @@ class BulkStudentPromotion(models.TransientModel):
             'target': 'new',
         }
 
+    def _assign_classrooms(self, students):
+        """Répartir les élèves entre les sections du niveau suivant
+
+        Les classes de la nouvelle année et leurs effectifs actuels (par sexe)
+        sont chargés en deux requêtes. Chaque élève est placé dans la section
+        la moins remplie de son niveau qui n'a pas atteint sa capacité (ou,
+        avec ``balance_gender``, celle qui compte le moins d'élèves de son
+        sexe). Un élève reste sans classe lorsque toutes les sections sont
+        pleines.
+
+        :return: dict {student_id: classroom_id}
+        """
+        self.ensure_one()
+        next_levels = students.level_id.next_level_id
+        if not next_levels:
+            return {}
+
+        classrooms = self.env['silina.classroom'].search([
+            ('level_id', 'in', next_levels.ids),
+            ('academic_year_id', '=', self.new_academic_year_id.id),
+        ], order='name, id')
+
+        sections_by_level = {}
+        for classroom in classrooms:
+            sections_by_level.setdefault(classroom.level_id.id, []).append({
+                'id': classroom.id,
+                'capacity': classroom.capacity,
+                'total': 0,
+                'genders': {},
+            })
+
+        # Effectifs déjà inscrits dans les classes de destination, par sexe
+        sections = {section['id']: section for level in sections_by_level.values() for section in level}
+        for classroom, gender, count in self.env['silina.student']._read_group(
+                [('classroom_id', 'in', classrooms.ids)], ['classroom_id', 'gender'], ['__count']):
+            section = sections[classroom.id]
+            section['total'] += count
+            section['genders'][gender] = section['genders'].get(gender, 0) + count
+
+        assignments = {}
+        for student in students:
+            available = [
+                section for section in sections_by_level.get(student.level_id.next_level_id.id, [])
+                if not section['capacity'] or section['total'] < section['capacity']
+            ]
+            if not available:
+                continue
+            if self.balance_gender:
+                section = min(available, key=lambda s: (s['genders'].get(student.gender, 0), s['total']))
+            else:
+                section = min(available, key=lambda s: s['total'])
+            section['total'] += 1
+            section['genders'][student.gender] = section['genders'].get(student.gender, 0) + 1
+            assignments[student.id] = section['id']
+        return assignments
+
     def action_promote(self):
         """Effectuer la promotion en masse"""
         self.ensure_one()
@@ -149,64 +239,7 @@ class BulkStudentPromotion(models.TransientModel):
         if self.state != 'preview':
             raise ValidationError(_('Veuillez d\'abord prévisualiser les promotions!'))
 
-        promoted_count = 0
-        errors = []
-
-        for line in self.line_ids:
-            try:
-                if not line.new_classroom_id:
-                    errors.append(f"{line.student_id.name}: Aucune classe de destination")
-                    continue
-
-                # Créer le nouvel enregistrement élève pour la nouvelle année
-                new_student_vals = {
-                    'first_name': line.student_id.first_name,
-                    'last_name': line.student_id.last_name,
-                    'registration_number': line.student_id.registration_number,
-                    'image_1920': line.student_id.image_1920,
-                    'gender': line.student_id.gender,
-                    'date_of_birth': line.student_id.date_of_birth,
-                    'place_of_birth': line.student_id.place_of_birth,
-                    'nationality': line.student_id.nationality.id,
-                    'blood_group': line.student_id.blood_group,
-                    'email': line.student_id.email,
-                    'phone': line.student_id.phone,
-                    'mobile': line.student_id.mobile,
-                    'street': line.student_id.street,
-                    'street2': line.student_id.street2,
-                    'city': line.student_id.city,
-                    'state_id': line.student_id.state_id.id,
-                    'zip': line.student_id.zip,
-                    'country_id': line.student_id.country_id.id,
-                    'academic_year_id': self.new_academic_year_id.id,
-                    'classroom_id': line.new_classroom_id.id,
-                    'enrollment_date': self.promotion_date,
-                    'state': 'enrolled',
-                    'parent_ids': [(6, 0, line.student_id.parent_ids.ids)],
-                    'father_name': line.student_id.father_name,
-                    'mother_name': line.student_id.mother_name,
-                    'guardian_name': line.student_id.guardian_name,
-                    'allergies': line.student_id.allergies,
-                    'medical_conditions': line.student_id.medical_conditions,
-                    'emergency_contact_name': line.student_id.emergency_contact_name,
-                    'emergency_contact_phone': line.student_id.emergency_contact_phone,
-                }
-
-                new_student = self.env['silina.student'].create(new_student_vals)
-
-                # Marquer l'ancien élève comme promu/gradué
-                if line.new_level_id:
-                    line.student_id.state = 'promoted'
-                else:
-                    line.student_id.state = 'graduated'
-
-                promoted_count += 1
-                line.state = 'done'
-
-            except Exception as e:
-                errors.append(f"{line.student_id.name}: {str(e)}")
-                line.state = 'error'
-                line.error_message = str(e)
+        promoted_count, errors = self._promote_lines(self.line_ids)
 
         self.state = 'done'
 
@@ -226,6 +259,179 @@ class BulkStudentPromotion(models.TransientModel):
             }
         }
 
+    def _promote_lines(self, lines):
+        """Promouvoir les élèves des lignes données, par lots
+
+        Chaque lot crée les élèves de la nouvelle année en un seul
+        ``create(vals_list)``, réutilise les pièces jointes des photos (sans
+        relire ni redimensionner les images) et met à jour l'état des anciens
+        élèves en une écriture groupée. Un lot en échec est rejoué élève par
+        élève pour isoler l'erreur.
+
+        :return: tuple (nombre d'élèves promus, liste des erreurs)
+        """
+        self.ensure_one()
+        promoted_count = 0
+        errors = []
+
+        lines_without_classroom = lines.filtered(lambda l: not l.new_classroom_id)
+        for line in lines_without_classroom:
+            errors.append(f"{line.student_id.name}: Aucune classe de destination")
+
+        lines_to_promote = lines - lines_without_classroom
+        for batch in split_every(self._promotion_batch_size, lines_to_promote.ids, lines.browse):
+            try:
+                with self.env.cr.savepoint():
+                    self._promote_batch(batch)
+                promoted_count += len(batch)
+                batch.write({'state': 'done'})
+            except Exception as batch_error:
+                _logger.warning("Échec de la promotion groupée, reprise élève par élève: %s", batch_error)
+                for line in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            self._promote_batch(line)
+                        promoted_count += 1
+                        line.state = 'done'
+                    except Exception as e:
+                        errors.append(f"{line.student_id.name}: {str(e)}")
+                        line.state = 'error'
+                        line.error_message = str(e)
+
+        return promoted_count, errors
+
+    def _promote_batch(self, lines):
+        """Créer en bloc les élèves de la nouvelle année et clôturer les anciens"""
+        students = lines.student_id
+        Student = self.env['silina.student'].with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_create_nosubscribe=True,
+        )
+        new_students = Student.create([self._prepare_promoted_student_vals(line) for line in lines])
+        self._copy_student_images([line.student_id.id for line in lines], new_students)
+
+        # Marquer les anciens élèves comme promus/gradués (une écriture par état)
+        promoted = lines.filtered('new_level_id').student_id
+        (students - promoted).write({'state': 'graduated'})
+        promoted.write({'state': 'promoted'})
+        return new_students
+
+    def _prepare_promoted_student_vals(self, line):
+        """Valeurs du nouvel enregistrement élève pour la nouvelle année (sans la photo)"""
+        student = line.student_id
+        return {
+            'first_name': student.first_name,
+            'last_name': student.last_name,
+            'registration_number': student.registration_number,
+            'gender': student.gender,
+            'date_of_birth': student.date_of_birth,
+            'place_of_birth': student.place_of_birth,
+            'nationality': student.nationality.id,
+            'blood_group': student.blood_group,
+            'email': student.email,
+            'phone': student.phone,
+            'mobile': student.mobile,
+            'street': student.street,
+            'street2': student.street2,
+            'city': student.city,
+            'state_id': student.state_id.id,
+            'zip': student.zip,
+            'country_id': student.country_id.id,
+            'academic_year_id': self.new_academic_year_id.id,
+            'classroom_id': line.new_classroom_id.id,
+            'enrollment_date': self.promotion_date,
+            'state': 'enrolled',
+            'parent_ids': [(6, 0, student.parent_ids.ids)],
+            'father_name': student.father_name,
+            'mother_name': student.mother_name,
+            'guardian_name': student.guardian_name,
+            'allergies': student.allergies,
+            'medical_conditions': student.medical_conditions,
+            'emergency_contact_name': student.emergency_contact_name,
+            'emergency_contact_phone': student.emergency_contact_phone,
+        }
+
+    def _copy_student_images(self, old_student_ids, new_students):
+        """Rattacher aux nouveaux élèves les photos des anciens sans recopier les images
+
+        Les pièces jointes des champs image_1920 et image_128 sont dupliquées
+        en SQL en pointant vers le même fichier du filestore (même mécanisme
+        que la déduplication par empreinte d'ir.attachment).
+        """
+        # La création a planifié le recalcul (redimensionnement) de image_128 :
+        # l'annuler, la miniature de l'ancien élève est réutilisée telle quelle
+        Student = self.env['silina.student']
+        self.env.remove_to_compute(Student._fields['image_128'], new_students)
+        new_students.flush_recordset()
+        self.env['ir.attachment'].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO ir_attachment (
+                name, res_model, res_field, res_id, company_id, type, url, public,
+                store_fname, db_datas, file_size, checksum, mimetype, index_content,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT attachment.name, attachment.res_model, attachment.res_field, mapping.new_id,
+                   attachment.company_id, attachment.type, attachment.url, attachment.public,
+                   attachment.store_fname, attachment.db_datas, attachment.file_size,
+                   attachment.checksum, attachment.mimetype, attachment.index_content,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM ir_attachment attachment
+              JOIN unnest(%(old_ids)s::int[], %(new_ids)s::int[]) AS mapping(old_id, new_id)
+                ON attachment.res_id = mapping.old_id
+             WHERE attachment.res_model = 'silina.student'
+               AND attachment.res_field IN ('image_1920', 'image_128')
+        """, {
+            'uid': self.env.uid,
+            'old_ids': old_student_ids,
+            'new_ids': new_students.ids,
+        })
+        new_students.invalidate_recordset(['image_1920', 'image_128'])
+
+    def action_promote_background(self):
+        """Effectuer la promotion en arrière-plan (tâche exécutée par lots par le cron)"""
+        self.ensure_one()
+
+        if self.state != 'preview':
+            raise ValidationError(_('Veuillez d\'abord prévisualiser les promotions!'))
+
+        job = self.env['silina.job'].enqueue(
+            name=_('Passage en masse vers %s') % self.new_academic_year_id.name,
+            res_model=self._name,
+            method_name='_job_promote',
+            record_ids=self.line_ids.student_id.ids,
+            payload={
+                'new_academic_year_id': self.new_academic_year_id.id,
+                'promotion_date': fields.Date.to_string(self.promotion_date),
+                'lines': {
+                    str(line.student_id.id): [line.new_level_id.id, line.new_classroom_id.id]
+                    for line in self.line_ids
+                },
+            },
+        )
+        self.state = 'done'
+        return job.action_open()
+
+    @api.model
+    def _job_promote(self, job, student_ids):
+        """Traiter un lot de la tâche de promotion en masse"""
+        payload = job.get_payload()
+        assignments = payload.pop('lines')
+        wizard = self.new(payload)
+        Line = self.env['silina.bulk.student.promotion.line']
+        lines = Line.browse()
+        for student in self.env['silina.student'].browse(student_ids).exists():
+            new_level_id, new_classroom_id = assignments[str(student.id)]
+            lines |= Line.new({
+                'student_id': student.id,
+                'current_classroom_id': student.classroom_id.id,
+                'current_level_id': student.level_id.id,
+                'new_level_id': new_level_id,
+                'new_classroom_id': new_classroom_id,
+            })
+        promoted_count, errors = wizard._promote_lines(lines)
+        return errors
+
     def action_back_to_draft(self):
         """Retour à la configuration"""
         self.ensure_one()
@@ -0,0 +1,409 @@
+import base64
+import logging
+from collections import defaultdict
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import float_compare, split_every
+
+from .student_import import _normalize_key
+
+_logger = logging.getLogger(__name__)
+
+
+# Colonnes reconnues dans un relevé : clé interne -> en-têtes acceptés (sans accents, en minuscules)
+_STATEMENT_COLUMNS = {
+    'registration_number': ('registration_number', 'matricule'),
+    'amount': ('amount', 'montant'),
+    'reference': ('reference', 'ref', 'libelle', 'transaction'),
+    'date': ('date', 'date de paiement'),
+}
+
+
+class FeeBatchPayment(models.TransientModel):
+    """Enregistrement en lot des paiements de frais scolaires
+
+    Les lignes (saisies ou importées d'un relevé bancaire / Mobile Money)
+    sont rapprochées des factures ouvertes en une requête, les paiements
+    sont créés et validés en lot puis lettrés avec leurs factures en un
+    seul appel de lettrage par lot.
+    """
+    _name = 'silina.fee.batch.payment.wizard'
+    _description = 'Paiement en Lot des Frais Scolaires'
+
+    # Nombre de paiements créés par lot
+    _payment_batch_size = 200
+
+    fee_type_id = fields.Many2one(
+        'silina.fee.type',
+        string='Type de frais',
+        help="Limiter le rapprochement aux factures de ce type de frais (toutes les factures de frais sinon)"
+    )
+
+    payment_method = fields.Selection([
+        ('cash', 'Espèces'),
+        ('bank_transfer', 'Virement bancaire'),
+        ('check', 'Chèque'),
+        ('mobile_money', 'Mobile Money'),
+    ], string='Mode de paiement', default='cash', required=True)
+
+    payment_date = fields.Date(
+        string='Date de paiement',
+        default=fields.Date.today,
+        required=True,
+        help="Date utilisée pour les lignes sans date"
+    )
+
+    statement_file = fields.Binary(
+        string='Relevé',
+        help="Fichier CSV ou XLSX avec les colonnes Matricule, Montant, Référence et Date (optionnelle)"
+    )
+    statement_filename = fields.Char(string='Nom du fichier')
+
+    line_ids = fields.One2many(
+        'silina.fee.batch.payment.line',
+        'wizard_id',
+        string='Paiements'
+    )
+
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Devise',
+        default=lambda self: self.env.company.currency_id
+    )
+    total_amount = fields.Monetary(
+        string='Montant total',
+        compute='_compute_totals',
+        currency_field='currency_id'
+    )
+    line_count = fields.Integer(
+        string='Nombre de paiements',
+        compute='_compute_totals'
+    )
+
+    done_count = fields.Integer(string='Paiements enregistrés', readonly=True)
+    error_count = fields.Integer(
+        string='Lignes en erreur',
+        compute='_compute_totals'
+    )
+
+    state = fields.Selection([
+        ('draft', 'Saisie'),
+        ('done', 'Terminé'),
+    ], string='État', default='draft')
+
+    @api.depends('line_ids.amount', 'line_ids.state')
+    def _compute_totals(self):
+        for record in self:
+            record.total_amount = sum(record.line_ids.mapped('amount'))
+            record.line_count = len(record.line_ids)
+            record.error_count = len(record.line_ids.filtered(lambda l: l.state == 'error'))
+
+    def _reopen(self):
+        return {
+            'name': _('Paiement en Lot'),
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_load_statement(self):
+        """Créer les lignes de paiement à partir du relevé importé"""
+        self.ensure_one()
+        if not self.statement_file:
+            raise ValidationError(_('Veuillez sélectionner un relevé à importer!'))
+
+        content = base64.b64decode(self.statement_file)
+        reader = self.env['silina.student.import.wizard']
+        if (self.statement_filename or '').lower().endswith('.xlsx'):
+            rows = reader._iter_xlsx(content)
+        else:
+            rows = reader._iter_csv(content)
+
+        header = next(rows, None)
+        aliases = {alias: key for key, names in _STATEMENT_COLUMNS.items() for alias in names}
+        columns = {}
+        for index, label in enumerate(header or []):
+            key = aliases.get(_normalize_key(label))
+            if key and key not in columns:
+                columns[key] = index
+        if not {'registration_number', 'amount'} <= columns.keys():
+            raise UserError(_('Colonnes obligatoires manquantes dans le relevé: "Matricule" et "Montant".'))
+
+        entries = []
+        for row in rows:
+            values = {key: row[index] if index < len(row) else None for key, index in columns.items()}
+            if not any(value not in (None, '') for value in values.values()):
+                continue
+            entries.append(values)
+
+        numbers = {reader._cell_text(entry['registration_number']) for entry in entries} - {False}
+        students = self._resolve_registration_numbers(numbers)
+
+        line_vals = []
+        for entry in entries:
+            number = reader._cell_text(entry['registration_number'])
+            amount = self._parse_amount(entry.get('amount'))
+            if not students.get(number):
+                error_message = _('Matricule introuvable')
+            elif amount <= 0:
+                error_message = _('Montant invalide')
+            else:
+                error_message = False
+            line_vals.append({
+                'wizard_id': self.id,
+                'registration_number': number,
+                'student_id': students.get(number, False),
+                'amount': amount,
+                'reference': reader._cell_text(entry.get('reference')),
+                'payment_date': reader._cell_date(entry.get('date')),
+                'state': 'error' if error_message else 'draft',
+                'error_message': error_message,
+            })
+        self.env['silina.fee.batch.payment.line'].create(line_vals)
+        self.statement_file = False
+        return self._reopen()
+
+    def _resolve_registration_numbers(self, numbers):
+        """Inscription à créditer pour chaque matricule du relevé, en deux requêtes
+
+        Un matricule est unique par année scolaire : un élève réinscrit a une
+        inscription par année. Le paiement va à l'inscription la plus
+        ancienne ayant des factures ouvertes (arriérés d'abord), sinon à
+        celle de l'année scolaire courante, sinon à la plus récente.
+
+        :return: dict {matricule: student_id}
+        """
+        enrolments = defaultdict(list)
+        for student in self.env['silina.student'].search_read(
+                [('registration_number', 'in', list(numbers))], ['registration_number', 'academic_year_id'],
+                order='id', load=None):
+            enrolments[student['registration_number']].append(student)
+
+        domain = [
+            ('silina_student_id', 'in', [student['id'] for group in enrolments.values() for student in group]),
+            ('move_type', '=', 'out_invoice'),
+            ('state', '=', 'posted'),
+            ('payment_state', 'in', ['not_paid', 'partial']),
+        ]
+        if self.fee_type_id:
+            domain.append(('silina_fee_type_id', '=', self.fee_type_id.id))
+        indebted_ids = {student.id for student, in self.env['account.move']._read_group(domain, ['silina_student_id'])}
+        current_year_id = self.env['silina.academic.year'].get_current_year().id
+
+        resolved = {}
+        for number, group in enrolments.items():
+            student = next((student for student in group if student['id'] in indebted_ids), None) \
+                or next((student for student in group if student['academic_year_id'] == current_year_id), None) \
+                or group[-1]
+            resolved[number] = student['id']
+        return resolved
+
+    @api.model
+    def _parse_amount(self, value):
+        if isinstance(value, (int, float)):
+            return float(value)
+        text = str(value or '').replace('\xa0', '').replace(' ', '')
+        if ',' in text and '.' not in text:
+            text = text.replace(',', '.')
+        else:
+            text = text.replace(',', '')
+        try:
+            return float(text)
+        except ValueError:
+            return 0.0
+
+    def action_process(self):
+        """Créer, valider et lettrer tous les paiements des lignes en attente"""
+        self.ensure_one()
+        lines = self.line_ids.filtered(lambda l: l.state == 'draft')
+        if not lines:
+            raise ValidationError(_('Aucun paiement à traiter!'))
+
+        journal = self._get_payment_journal()
+        lines.student_id._create_partners()
+        open_invoices = self._get_open_invoices(lines.student_id)
+
+        done_count = 0
+        for batch in split_every(self._payment_batch_size, lines.ids, lines.browse):
+            try:
+                with self.env.cr.savepoint():
+                    done_count += self._process_lines(batch, journal, open_invoices)
+            except Exception as batch_error:
+                _logger.warning("Paiement en lot: lot en échec (%s), reprise ligne par ligne", batch_error)
+                for line in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            done_count += self._process_lines(line, journal, open_invoices)
+                    except Exception as e:
+                        line.write({'state': 'error', 'error_message': str(e)})
+
+        self.write({
+            'state': 'done',
+            'done_count': done_count,
+        })
+        return self._reopen()
+
+    def _get_open_invoices(self, students):
+        """Factures de frais ouvertes des élèves, en une requête
+
+        :return: dict {student_id: [factures de la plus ancienne échéance à la plus récente]}
+        """
+        domain = [
+            ('silina_student_id', 'in', students.ids),
+            ('move_type', '=', 'out_invoice'),
+            ('state', '=', 'posted'),
+            ('payment_state', 'in', ['not_paid', 'partial']),
+        ]
+        if self.fee_type_id:
+            domain.append(('silina_fee_type_id', '=', self.fee_type_id.id))
+
+        open_invoices = defaultdict(list)
+        for invoice in self.env['account.move'].search(domain, order='invoice_date_due, id'):
+            open_invoices[invoice.silina_student_id.id].append(invoice)
+        return open_invoices
+
+    def _process_lines(self, lines, journal, open_invoices):
+        """Créer, valider et lettrer les paiements d'un lot de lignes
+
+        Chaque ligne est affectée aux factures ouvertes de l'élève, de la
+        plus ancienne échéance à la plus récente. Le reste dû de chaque
+        facture est suivi en mémoire pour plusieurs paiements du même élève.
+
+        :return: nombre de paiements enregistrés
+        """
+        residuals = {}
+        allocations = []
+        payment_vals_list = []
+        for line in lines:
+            if not line.student_id or line.amount <= 0:
+                raise ValidationError(_('Ligne %s: élève et montant positif requis') % (line.registration_number or ''))
+            partner = line.student_id.partner_id
+            invoices = [
+                invoice for invoice in open_invoices.get(line.student_id.id, [])
+                if residuals.setdefault(invoice.id, invoice.amount_residual) > 0
+            ]
+            if not invoices:
+                raise ValidationError(_('%s: aucune facture ouverte') % line.student_id.name)
+            open_amount = sum(residuals[invoice.id] for invoice in invoices)
+            if float_compare(line.amount, open_amount, precision_rounding=self.currency_id.rounding) > 0:
+                raise ValidationError(_(
+                    '%(student)s: le montant (%(amount)s) dépasse le reste dû (%(residual)s)'
+                ) % {'student': line.student_id.name, 'amount': line.amount, 'residual': open_amount})
+
+            remaining = line.amount
+            targets = []
+            for invoice in invoices:
+                if remaining <= 0:
+                    break
+                allocated = min(remaining, residuals[invoice.id])
+                residuals[invoice.id] -= allocated
+                remaining -= allocated
+                targets.append(invoice)
+            allocations.append((line, targets))
+
+            payment_vals_list.append({
+                'payment_type': 'inbound',
+                'partner_type': 'customer',
+                'partner_id': partner.id,
+                'amount': line.amount,
+                'date': line.payment_date or self.payment_date,
+                'journal_id': journal.id,
+                'memo': line.reference or False,
+            })
+
+        payments = self.env['account.payment'].create(payment_vals_list)
+        payments.action_post()
+
+        # Un seul lettrage pour tout le lot : une entrée du plan par élève,
+        # regroupant ses factures ciblées et ses paiements du lot
+        moves_by_partner = defaultdict(lambda: self.env['account.move'])
+        for (line, invoices), payment in zip(allocations, payments):
+            moves_by_partner[payment.partner_id.id] |= payment.move_id.union(*invoices)
+        reconciliation_plan = [
+            moves.line_ids.filtered(
+                lambda l: l.account_id.account_type == 'asset_receivable' and not l.reconciled
+            )
+            for moves in moves_by_partner.values()
+        ]
+        self.env['account.move.line']._reconcile_plan(reconciliation_plan)
+
+        for (line, invoices), payment in zip(allocations, payments):
+            line.write({
+                'state': 'done',
+                'payment_id': payment.id,
+                'invoice_ids': [(6, 0, [invoice.id for invoice in invoices])],
+                'error_message': False,
+            })
+        return len(payments)
+
+    def _get_payment_journal(self):
+        """Récupérer le journal de paiement approprié"""
+        journal_type = 'cash' if self.payment_method == 'cash' else 'bank'
+        journal = self.env['account.journal'].search([
+            ('type', '=', journal_type),
+            ('company_id', '=', self.env.company.id),
+        ], limit=1)
+        if not journal:
+            raise ValidationError(_(
+                'Aucun journal de type %s trouvé! Veuillez configurer un journal de paiement.'
+            ) % journal_type)
+        return journal
+
+
+class FeeBatchPaymentLine(models.TransientModel):
+    _name = 'silina.fee.batch.payment.line'
+    _description = 'Ligne de Paiement en Lot'
+
+    wizard_id = fields.Many2one(
+        'silina.fee.batch.payment.wizard',
+        string='Assistant',
+        required=True,
+        ondelete='cascade'
+    )
+
+    student_id = fields.Many2one(
+        'silina.student',
+        string='Élève'
+    )
+    registration_number = fields.Char(string='Matricule')
+
+    currency_id = fields.Many2one(
+        related='wizard_id.currency_id',
+        string='Devise'
+    )
+    amount = fields.Monetary(
+        string='Montant',
+        currency_field='currency_id'
+    )
+    reference = fields.Char(string='Référence')
+    payment_date = fields.Date(string='Date')
+
+    payment_id = fields.Many2one(
+        'account.payment',
+        string='Paiement',
+        readonly=True
+    )
+    invoice_ids = fields.Many2many(
+        'account.move',
+        string='Factures',
+        readonly=True
+    )
+
+    state = fields.Selection([
+        ('draft', 'En attente'),
+        ('done', 'Enregistré'),
+        ('error', 'Erreur'),
+    ], string='État', default='draft')
+
+    error_message = fields.Text(string='Message d\'erreur')
+
+    @api.onchange('student_id')
+    def _onchange_student_id(self):
+        if self.student_id:
+            self.registration_number = self.student_id.registration_number
+            if self.state == 'error':
+                self.state = 'draft'
+                self.error_message = False
@@ -1,12 +1,19 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every
 from dateutil.relativedelta import relativedelta
+import logging
+
+_logger = logging.getLogger(__name__)
 
 
 class GenerateFeeInvoices(models.TransientModel):
     _name = 'silina.generate.fee.invoices.wizard'
     _description = 'Assistant de Génération de Factures de Frais'
 
+    # Nombre d'élèves traités par lot (une création et une validation groupées par lot)
+    _invoice_batch_size = 200
+
     fee_type_id = fields.Many2one(
         'silina.fee.type',
         string='Type de frais',
@@ -107,53 +114,8 @@ class GenerateFeeInvoices(models.TransientModel):
         if not students:
             raise ValidationError(_('Aucun élève éligible trouvé!'))
 
-        # Générer les factures
-        invoice_count = 0
-        errors = []
-
-        for student in students:
-            try:
-                # S'assurer que l'élève a un contact partner
-                if not student.partner_id:
-                    student._create_partner()
-
-                # Vérifier si des factures existent déjà pour cet élève
-                existing_invoices = self.env['account.move'].search([
-                    ('partner_id', '=', student.partner_id.id),
-                    ('invoice_line_ids.product_id', '=', self.fee_type_id.product_id.id),
-                    ('state', 'in', ['draft', 'posted']),
-                ])
-
-                if existing_invoices:
-                    errors.append(f"{student.name}: Des factures existent déjà")
-                    continue
-
-                # Créer une facture par tranche
-                for installment in self.fee_type_id.installment_ids:
-                    due_date = self._compute_due_date(installment)
-
-                    invoice_vals = {
-                        'move_type': 'out_invoice',
-                        'partner_id': student.partner_id.id,  # Utiliser le contact de l'élève
-                        'invoice_date': fields.Date.today(),
-                        'invoice_date_due': due_date,
-                        'invoice_origin': f"{self.fee_type_id.name} - {installment.name}",
-                        'invoice_line_ids': [(0, 0, {
-                            'product_id': self.fee_type_id.product_id.id,
-                            'name': f"{self.fee_type_id.name} - {installment.name}\nÉlève: {student.name}\nMatricule: {student.registration_number}\nClasse: {student.classroom_id.name if student.classroom_id else 'N/A'}\nAnnée: {self.academic_year_id.name}",
-                            'quantity': 1,
-                            'price_unit': installment.amount,
-                            'account_id': self.fee_type_id.account_id.id if self.fee_type_id.account_id else self.fee_type_id.product_id.categ_id.property_account_income_categ_id.id,
-                        })],
-                    }
-
-                    invoice = self.env['account.move'].create(invoice_vals)
-                    # Post the invoice immediately
-                    invoice.action_post()
-                    invoice_count += 1
-
-            except Exception as e:
-                errors.append(f"{student.name}: {str(e)}")
+        # Générer les factures par lots
+        invoice_count, errors = self._generate_invoices_for_students(students)
 
         # Afficher le résultat
         message = _('%s factures ont été créées avec succès.') % invoice_count
@@ -173,6 +135,136 @@ class GenerateFeeInvoices(models.TransientModel):
             }
         }
 
+    def action_generate_invoices_background(self):
+        """Générer les factures en arrière-plan (tâche exécutée par lots par le cron)"""
+        self.ensure_one()
+
+        if not self.fee_type_id.installment_ids:
+            raise ValidationError(_(
+                'Aucune tranche de paiement n\'est définie pour ce type de frais!'
+            ))
+
+        students = self._get_students()
+        if not students:
+            raise ValidationError(_('Aucun élève éligible trouvé!'))
+
+        job = self.env['silina.job'].enqueue(
+            name=_('Factures %s (%s)') % (self.fee_type_id.name, self.academic_year_id.name),
+            res_model=self._name,
+            method_name='_job_generate_invoices',
+            record_ids=students.ids,
+            payload={
+                'fee_type_id': self.fee_type_id.id,
+                'academic_year_id': self.academic_year_id.id,
+                'partner_id': self.partner_id.id,
+                'start_date': fields.Date.to_string(self.start_date),
+            },
+            chunk_size=self._invoice_batch_size,
+        )
+        return job.action_open()
+
+    @api.model
+    def _job_generate_invoices(self, job, student_ids):
+        """Traiter un lot de la tâche de génération de factures"""
+        wizard = self.new(job.get_payload())
+        students = self.env['silina.student'].browse(student_ids).exists()
+        dummy, errors = wizard._generate_invoices_for_students(students)
+        return errors
+
+    def _generate_invoices_for_students(self, students):
+        """Générer les factures de tous les élèves par lots
+
+        Les factures existantes sont préchargées en une seule requête, les
+        valeurs de toutes les factures sont préparées en mémoire puis créées
+        et validées en bloc, lot par lot. Chaque lot est exécuté dans un
+        savepoint : en cas d'échec, le lot est rejoué élève par élève pour
+        isoler l'élève en erreur sans annuler les autres.
+
+        :return: tuple (nombre de factures créées, liste des erreurs)
+        """
+        self.ensure_one()
+        errors = []
+
+        # S'assurer que chaque élève a un contact partner (création groupée,
+        # notamment lorsque la création a été différée à l'inscription)
+        students._create_partners()
+
+        # Précharger en une requête les élèves ayant déjà des factures pour ce type de frais
+        invoiced_student_ids = self._get_invoiced_student_ids(students.ids)
+
+        for student in students:
+            if student.id in invoiced_student_ids:
+                errors.append(f"{student.name}: Des factures existent déjà")
+        students_to_invoice = students.filtered(lambda s: s.id not in invoiced_student_ids)
+
+        invoice_count = 0
+        for batch in split_every(self._invoice_batch_size, students_to_invoice.ids, self.env['silina.student'].browse):
+            try:
+                with self.env.cr.savepoint():
+                    invoice_count += len(self._create_invoices(batch))
+            except Exception as batch_error:
+                _logger.warning("Échec de la génération groupée de factures, reprise élève par élève: %s", batch_error)
+                for student in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            invoice_count += len(self._create_invoices(student))
+                    except Exception as e:
+                        errors.append(f"{student.name}: {str(e)}")
+
+        return invoice_count, errors
+
+    def _get_invoiced_student_ids(self, student_ids):
+        """Retourner les élèves ayant déjà une facture pour ce type de frais et cette année"""
+        if not student_ids:
+            return set()
+        groups = self.env['account.move']._read_group([
+            ('silina_student_id', 'in', student_ids),
+            ('silina_fee_type_id', '=', self.fee_type_id.id),
+            ('silina_academic_year_id', '=', self.academic_year_id.id),
+            ('state', 'in', ['draft', 'posted']),
+        ], ['silina_student_id'], ['__count'])
+        return {student.id for student, count in groups}
+
+    def _create_invoices(self, students):
+        """Créer et valider en bloc une facture par tranche pour chaque élève"""
+        vals_list = self._prepare_invoice_vals_list(students)
+        invoices = self.env['account.move'].create(vals_list)
+        invoices.action_post()
+        return invoices
+
+    def _prepare_invoice_vals_list(self, students):
+        """Préparer en mémoire les valeurs des factures (une par tranche et par élève)"""
+        fee_type = self.fee_type_id
+        account_id = fee_type.account_id.id if fee_type.account_id else fee_type.product_id.categ_id.property_account_income_categ_id.id
+        today = fields.Date.today()
+        installments = [
+            (installment, self._compute_due_date(installment))
+            for installment in fee_type.installment_ids
+        ]
+
+        vals_list = []
+        for student in students:
+            for installment, due_date in installments:
+                vals_list.append({
+                    'move_type': 'out_invoice',
+                    'partner_id': student.partner_id.id,  # Utiliser le contact de l'élève
+                    'invoice_date': today,
+                    'invoice_date_due': due_date,
+                    'invoice_origin': f"{fee_type.name} - {installment.name}",
+                    'silina_student_id': student.id,
+                    'silina_fee_type_id': fee_type.id,
+                    'silina_academic_year_id': self.academic_year_id.id,
+                    'invoice_line_ids': [(0, 0, {
+                        'product_id': fee_type.product_id.id,
+                        'silina_installment_id': installment.id,
+                        'name': f"{fee_type.name} - {installment.name}\nÉlève: {student.name}\nMatricule: {student.registration_number}\nClasse: {student.classroom_id.name if student.classroom_id else 'N/A'}\nAnnée: {self.academic_year_id.name}",
+                        'quantity': 1,
+                        'price_unit': installment.amount,
+                        'account_id': account_id,
+                    })],
+                })
+        return vals_list
+
     def _get_students(self):
         """Récupérer les élèves concernés selon le mode de génération"""
         if self.generation_mode == 'student':
@@ -1,5 +1,15 @@
+import io
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.pdf import merge_pdf
+
+_logger = logging.getLogger(__name__)
 
 
 class GenerateReportCard(models.TransientModel):
@@ -65,6 +75,24 @@ class GenerateReportCard(models.TransientModel):
         ('en_US', 'Anglais'),
     ], string='Langue', default='fr_FR')
 
+    # Impression en masse
+    print_workers = fields.Integer(
+        string='Impressions parallèles',
+        default=lambda self: self._default_print_workers(),
+        help="Nombre de classes rendues simultanément lors de l'impression en masse "
+             "(paramètre système silina_edu.report_card_print_workers, par défaut le nombre de cœurs)"
+    )
+
+    mass_print_output = fields.Selection([
+        ('zip', 'Archive ZIP (un PDF par classe)'),
+        ('merge', 'PDF unique fusionné'),
+    ], string='Format de l\'impression en masse', default='zip', required=True)
+
+    @api.model
+    def _default_print_workers(self):
+        workers = self.env['ir.config_parameter'].sudo().get_param('silina_edu.report_card_print_workers')
+        return int(workers) if workers else (os.cpu_count() or 1)
+
     @api.onchange('generation_type')
     def _onchange_generation_type(self):
         """Réinitialiser les champs selon le type"""
@@ -104,48 +132,36 @@ class GenerateReportCard(models.TransientModel):
             ('state', 'in', ['in_progress', 'completed'])
         ])
 
-        # Filtrer pour ne garder que les examens où au moins un élève a des résultats
-        exam_ids_with_results = self.env['silina.exam.result'].search([
+        # Couples (examen, élève) ayant des résultats, en une seule requête groupée
+        result_groups = self.env['silina.exam.result']._read_group([
             ('exam_id', 'in', exams.ids),
             ('student_id', 'in', students.ids)
-        ]).mapped('exam_id')
+        ], ['exam_id', 'student_id'], ['__count'])
+        pairs_with_results = {(exam.id, student.id) for exam, student, count in result_groups}
 
-        if not exam_ids_with_results:
+        if not pairs_with_results:
             raise ValidationError(_('Aucun résultat trouvé pour les élèves sélectionnés dans cette année scolaire!'))
 
-        # Générer les résumés pour chaque examen
+        exam_ids_with_results = list({exam_id for exam_id, student_id in pairs_with_results})
+
+        # Résumés existants, en une seule requête
         summary_model = self.env['silina.exam.result.summary']
-        for exam in exam_ids_with_results:
-            for student in students:
-                # Vérifier si l'élève a des résultats pour cet examen
-                has_results = self.env['silina.exam.result'].search_count([
-                    ('exam_id', '=', exam.id),
-                    ('student_id', '=', student.id)
-                ])
-
-                if has_results:
-                    # Vérifier si un résumé existe déjà
-                    existing = summary_model.search([
-                        ('exam_id', '=', exam.id),
-                        ('student_id', '=', student.id)
-                    ])
-
-                    if not existing:
-                        # Créer le résumé
-                        summary_model.create({
-                            'exam_id': exam.id,
-                            'student_id': student.id,
-                        })
-
-            # Calculer les rangs par classe pour cet examen
-            for classroom in students.mapped('classroom_id'):
-                classroom_summaries = summary_model.search([
-                    ('exam_id', '=', exam.id),
-                    ('classroom_id', '=', classroom.id)
-                ])
-                sorted_summaries = classroom_summaries.sorted(key=lambda s: s.average, reverse=True)
-                for rank, summary in enumerate(sorted_summaries, 1):
-                    summary.rank = rank
+        existing = summary_model.search_read([
+            ('exam_id', 'in', exam_ids_with_results),
+            ('student_id', 'in', students.ids)
+        ], ['exam_id', 'student_id'], load=None)
+        existing_pairs = {(summary['exam_id'], summary['student_id']) for summary in existing}
+
+        # Créer tous les résumés manquants en un seul lot
+        summary_vals = [
+            {'exam_id': exam_id, 'student_id': student_id}
+            for exam_id, student_id in sorted(pairs_with_results - existing_pairs)
+        ]
+        if summary_vals:
+            summary_model.create(summary_vals)
+
+        # Calculer les rangs par classe (une seule mise à jour SQL par fonction de fenêtrage)
+        summary_model._compute_ranks(exam_ids_with_results, students.classroom_id.ids)
 
         return True
 
@@ -175,20 +191,216 @@ class GenerateReportCard(models.TransientModel):
 
         return self._generate_report(self.student_ids.ids)
 
-    def _generate_report(self, student_ids):
-        """Générer le rapport selon le modèle choisi"""
+    def action_generate_background(self):
+        """Générer les bulletins en arrière-plan (tâche exécutée par lots par le cron)
+
+        Les PDF de chaque lot sont joints à la tâche.
+        """
         self.ensure_one()
 
-        # Sélectionner le bon template
+        if not self.student_ids:
+            raise ValidationError(_('Aucun élève sélectionné!'))
+
+        job = self.env['silina.job'].enqueue(
+            name=_('Bulletins de notes %s') % self.academic_year_id.name,
+            res_model=self._name,
+            method_name='_job_render_report_cards',
+            prepare_method='_job_prepare_report_cards',
+            record_ids=self.student_ids.ids,
+            payload={
+                'academic_year_id': self.academic_year_id.id,
+                'template_type': self.template_type,
+                'include_rank': self.include_rank,
+                'include_statistics': self.include_statistics,
+                'include_comments': self.include_comments,
+                'language': self.language,
+            },
+            chunk_size=50,
+        )
+        return job.action_open()
+
+    def action_mass_print(self):
+        """Imprimer les bulletins en masse en arrière-plan
+
+        Les élèves sont découpés par classe ; chaque lot de la tâche rend
+        plusieurs classes en parallèle (chacune avec son propre curseur et
+        son propre processus wkhtmltopdf), puis les PDF sont fusionnés ou
+        archivés en ZIP à la fin de la tâche.
+        """
+        self.ensure_one()
+
+        if not self.student_ids:
+            raise ValidationError(_('Aucun élève sélectionné!'))
+
+        workers = max(self.print_workers, 1)
+        job = self.env['silina.job'].enqueue(
+            name=_('Impression en masse des bulletins %s') % self.academic_year_id.name,
+            res_model=self._name,
+            method_name='_job_mass_print_classrooms',
+            prepare_method='_job_prepare_report_cards',
+            finalize_method='_job_finalize_mass_print',
+            record_ids=list(dict.fromkeys(student.classroom_id.id or 0 for student in self.student_ids)),
+            payload={
+                'academic_year_id': self.academic_year_id.id,
+                'template_type': self.template_type,
+                'include_rank': self.include_rank,
+                'include_statistics': self.include_statistics,
+                'include_comments': self.include_comments,
+                'language': self.language,
+                'mass_print_output': self.mass_print_output,
+                'student_ids': self.student_ids.ids,
+            },
+            chunk_size=workers,
+        )
+        return job.action_open()
+
+    @api.model
+    def _job_mass_print_classrooms(self, job, classroom_ids):
+        """Rendre en parallèle le PDF de chaque classe du lot et le joindre à la tâche"""
+        payload = job.get_payload()
+        students = self.env['silina.student'].browse(payload['student_ids'])
+        wizard = self._job_wizard(job, payload['student_ids'])
+        report_name = self.env.ref(wizard._get_report_ref()).report_name
+        context = dict(self.env.context, **wizard._get_report_context())
+
+        chunks = []
+        for classroom_id in classroom_ids:
+            chunk_students = students.filtered(lambda s: (s.classroom_id.id or 0) == classroom_id)
+            if chunk_students:
+                name = chunk_students[0].classroom_id.name or _('Sans classe')
+                chunks.append((classroom_id, name, chunk_students.sorted('name').ids))
+
+        errors = []
+        for classroom_id, name, pdf_content, error in self._render_pdf_chunks(report_name, context, chunks, len(classroom_ids)):
+            if error:
+                errors.append(f"{name}: {error}")
+                continue
+            self.env['ir.attachment'].create({
+                'name': f"{name}.pdf",
+                'type': 'binary',
+                'raw': pdf_content,
+                'mimetype': 'application/pdf',
+                'res_model': job._name,
+                'res_id': job.id,
+                'description': 'silina_mass_print_chunk',
+            })
+        return errors
+
+    def _render_pdf_chunks(self, report_name, context, chunks, workers):
+        """Rendre les lots de bulletins, en parallèle si possible
+
+        Chaque thread ouvre son propre curseur : il ne voit que les données
+        validées (la préparation de la tâche est validée avant le premier lot).
+        wkhtmltopdf s'exécutant dans un processus séparé, les rendus se
+        répartissent sur les cœurs du serveur.
+        """
+        if workers <= 1 or len(chunks) <= 1 or self.env.registry.in_test_mode():
+            for classroom_id, name, student_ids in chunks:
+                try:
+                    pdf_content, dummy = self.env['ir.actions.report'].with_context(context)._render_qweb_pdf(
+                        report_name, res_ids=student_ids)
+                    yield classroom_id, name, pdf_content, False
+                except Exception as e:
+                    yield classroom_id, name, False, str(e)
+            return
+
+        dbname = self.env.cr.dbname
+        uid = self.env.uid
+        registry = self.env.registry
+
+        def render(student_ids):
+            threading.current_thread().dbname = dbname
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                pdf_content, dummy = env['ir.actions.report']._render_qweb_pdf(report_name, res_ids=student_ids)
+                return pdf_content
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(classroom_id, name, executor.submit(render, student_ids))
+                       for classroom_id, name, student_ids in chunks]
+            for classroom_id, name, future in futures:
+                try:
+                    yield classroom_id, name, future.result(), False
+                except Exception as e:
+                    _logger.exception("Rendu des bulletins de %s échoué", name)
+                    yield classroom_id, name, False, str(e)
+
+    @api.model
+    def _job_finalize_mass_print(self, job):
+        """Fusionner les PDF des classes (ou les archiver en ZIP) en un seul fichier"""
+        payload = job.get_payload()
+        chunk_attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', job._name),
+            ('res_id', '=', job.id),
+            ('description', '=', 'silina_mass_print_chunk'),
+        ], order='id')
+        if not chunk_attachments:
+            return
+
+        if payload.get('mass_print_output') == 'merge':
+            content = merge_pdf(chunk_attachments.mapped('raw'))
+            name, mimetype = f"{job.name}.pdf", 'application/pdf'
+        else:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for attachment in chunk_attachments:
+                    archive.writestr(attachment.name, attachment.raw)
+            content = buffer.getvalue()
+            name, mimetype = f"{job.name}.zip", 'application/zip'
+
+        self.env['ir.attachment'].create({
+            'name': name,
+            'type': 'binary',
+            'raw': content,
+            'mimetype': mimetype,
+            'res_model': job._name,
+            'res_id': job.id,
+        })
+        chunk_attachments.unlink()
+
+    @api.model
+    def _job_wizard(self, job, student_ids):
+        payload = job.get_payload()
+        payload.update({
+            'generation_type': 'student',
+            'student_ids': [(6, 0, student_ids)],
+        })
+        return self.new(payload)
+
+    @api.model
+    def _job_prepare_report_cards(self, job):
+        """Générer les résumés et les rangs une seule fois avant le rendu des lots"""
+        student_ids = job.get_payload().get('student_ids') or job.record_ids
+        self._job_wizard(job, student_ids).action_generate_summaries()
+
+    @api.model
+    def _job_render_report_cards(self, job, student_ids):
+        """Rendre le PDF d'un lot de bulletins et le joindre à la tâche"""
+        wizard = self._job_wizard(job, student_ids)
+        report = self.env.ref(wizard._get_report_ref())
+        pdf_content, dummy = self.env['ir.actions.report'].with_context(
+            **wizard._get_report_context()
+        )._render_qweb_pdf(report.report_name, res_ids=student_ids)
+        self.env['ir.attachment'].create({
+            'name': _('Bulletins %s - lot %s.pdf') % (job.name, job.next_index // job.chunk_size + 1),
+            'type': 'binary',
+            'raw': pdf_content,
+            'mimetype': 'application/pdf',
+            'res_model': job._name,
+            'res_id': job.id,
+        })
+        return []
+
+    def _get_report_ref(self):
+        """Référence de l'action de rapport selon le modèle choisi"""
         if self.template_type == 'standard':
-            report_ref = 'silina_edu.action_report_card_standard'
+            return 'silina_edu.action_report_card_standard'
         elif self.template_type == 'modern':
-            report_ref = 'silina_edu.action_report_card_modern'
-        else:
-            report_ref = 'silina_edu.action_report_card_detailed'
+            return 'silina_edu.action_report_card_modern'
+        return 'silina_edu.action_report_card_detailed'
 
-        # Préparer le contexte
-        context = {
+    def _get_report_context(self):
+        return {
             'academic_year_id': self.academic_year_id.id,
             'include_rank': self.include_rank,
             'include_statistics': self.include_statistics,
@@ -196,6 +408,16 @@ class GenerateReportCard(models.TransientModel):
             'lang': self.language,
         }
 
+    def _generate_report(self, student_ids):
+        """Générer le rapport selon le modèle choisi"""
+        self.ensure_one()
+
+        # Sélectionner le bon template
+        report_ref = self._get_report_ref()
+
+        # Préparer le contexte
+        context = self._get_report_context()
+
         # Générer le rapport
         students = self.env['silina.student'].browse(student_ids)
         return self.env.ref(report_ref).with_context(**context).report_action(students)
@@ -77,7 +77,7 @@ class StudentFeePayment(models.TransientModel):
     )
 
     overdue_invoices_count = fields.Integer(
-        string='Factures en retard',
+        string='Tranches en retard',
         compute='_compute_existing_invoices'
     )
 
@@ -109,27 +109,31 @@ class StudentFeePayment(models.TransientModel):
 
     @api.depends('student_id', 'fee_type_id')
     def _compute_existing_invoices(self):
+        # Soldes précalculés par tranche (voir silina.student.fee.ledger)
+        open_lines = self._get_open_ledger_lines()
+        today = fields.Date.today()
         for record in self:
-            if record.student_id and record.fee_type_id:
-                # Chercher les factures existantes pour cet élève et ce type de frais
-                invoices = self.env['account.move'].search([
-                    ('partner_id', '=', record.student_id.partner_id.id),
-                    ('move_type', '=', 'out_invoice'),
-                    ('state', '=', 'posted'),
-                    ('payment_state', 'in', ['not_paid', 'partial']),
-                    ('invoice_line_ids.product_id', '=', record.fee_type_id.product_id.id),
-                ])
-                record.existing_invoices = bool(invoices)
-                record.unpaid_amount = sum(invoices.mapped('amount_residual'))
-
-                # Compter les factures en retard
-                today = fields.Date.today()
-                overdue = invoices.filtered(lambda inv: inv.invoice_date_due and inv.invoice_date_due < today)
-                record.overdue_invoices_count = len(overdue)
-            else:
-                record.existing_invoices = False
-                record.unpaid_amount = 0.0
-                record.overdue_invoices_count = 0
+            lines = open_lines.filtered(
+                lambda l: l.student_id == record.student_id and l.fee_type_id == record.fee_type_id
+            )
+            record.existing_invoices = bool(lines)
+            record.unpaid_amount = sum(lines.mapped('amount_residual'))
+            record.overdue_invoices_count = len(lines.filtered(lambda l: l.due_date and l.due_date < today))
+
+    def _get_open_ledger_lines(self):
+        """Tranches restant dues des élèves et types de frais des assistants, en une requête
+
+        Lecture seule : les soldes sont recalculés en fin de transaction (voir
+        silina.student.fee.ledger), et juste avant le traitement du paiement.
+        """
+        Ledger = self.env['silina.student.fee.ledger']
+        if not self.student_id or not self.fee_type_id:
+            return Ledger
+        return Ledger.search([
+            ('student_id', 'in', self.student_id.ids),
+            ('fee_type_id', 'in', self.fee_type_id.ids),
+            ('amount_residual', '>', 0),
+        ])
 
     @api.onchange('student_id')
     def _onchange_student_id(self):
@@ -194,31 +198,38 @@ class StudentFeePayment(models.TransientModel):
         if self.installment_id:
             self.amount = self.installment_id.amount
 
-    @api.constrains('amount', 'student_id', 'fee_type_id')
+    @api.constrains('amount', 'student_id', 'fee_type_id', 'payment_type', 'installment_id')
     def _check_payment_amount(self):
         """Vérifier que le montant de paiement ne dépasse pas le montant restant dû"""
+        open_lines = self._get_open_ledger_lines()
         for record in self:
             if record.amount <= 0:
                 raise ValidationError(_('Le montant du paiement doit être supérieur à 0.'))
 
-            # Vérifier s'il existe une facture pour ce type de frais
-            if record.student_id and record.student_id.partner_id and record.fee_type_id:
-                invoice = self.env['account.move'].search([
-                    ('partner_id', '=', record.student_id.partner_id.id),
-                    ('move_type', '=', 'out_invoice'),
-                    ('state', '=', 'posted'),
-                    ('payment_state', 'in', ['not_paid', 'partial']),
-                    ('invoice_line_ids.product_id', '=', record.fee_type_id.product_id.id),
-                ], limit=1)
-
-                if invoice and record.amount > invoice.amount_residual:
+            # Le paiement est lettré avec la facture de l'année scolaire de l'élève
+            # (voir _get_or_create_invoice) : vérifier le reste dû de cette facture
+            # seulement, ou de la tranche choisie
+            lines = open_lines.filtered(
+                lambda l: l.student_id == record.student_id
+                and l.fee_type_id == record.fee_type_id
+                and l.academic_year_id == record.student_id.academic_year_id
+            )
+            if lines and record.payment_type == 'installment' and record.installment_id:
+                lines = lines.filtered(lambda l: l.installment_id == record.installment_id)
+                if not lines:
                     raise ValidationError(_(
-                        'Le montant du paiement (%s) ne peut pas dépasser le montant restant dû de la facture (%s).\n\n'
+                        'La tranche %s ne comporte plus de montant restant dû pour cet élève.'
+                    ) % record.installment_id.name)
+            if lines:
+                residual = sum(lines.mapped('amount_residual'))
+                if record.amount > residual:
+                    raise ValidationError(_(
+                        'Le montant du paiement (%s) ne peut pas dépasser le montant restant dû (%s).\n\n'
                         'Montant restant dû: %s %s'
                     ) % (
                         record.amount,
-                        invoice.amount_residual,
-                        invoice.amount_residual,
+                        residual,
+                        residual,
                         record.currency_id.symbol
                     ))
 
@@ -226,6 +237,10 @@ class StudentFeePayment(models.TransientModel):
         """Traiter le paiement : créer la facture et enregistrer le paiement"""
         self.ensure_one()
 
+        # Appliquer les recalculs de soldes en attente puis revérifier le montant
+        self.env['silina.student.fee.ledger']._refresh_dirty()
+        self._check_payment_amount()
+
         # Vérifier que l'élève a un partner
         if not self.student_id.partner_id:
             self.student_id._create_partner()
@@ -246,11 +261,11 @@ class StudentFeePayment(models.TransientModel):
         # Chercher TOUTES les factures existantes pour ce type de frais, cet élève et cette année
         # On inclut TOUTES les factures (payées ou non) pour éviter les doublons
         invoices = self.env['account.move'].search([
-            ('partner_id', '=', self.student_id.partner_id.id),
+            ('silina_student_id', '=', self.student_id.id),
+            ('silina_fee_type_id', '=', self.fee_type_id.id),
+            ('silina_academic_year_id', '=', self.student_id.academic_year_id.id),
             ('move_type', '=', 'out_invoice'),
             ('state', '=', 'posted'),
-            ('invoice_line_ids.product_id', '=', self.fee_type_id.product_id.id),
-            ('invoice_origin', 'ilike', self.student_id.academic_year_id.name),
         ], order='create_date desc')
 
         if invoices:
@@ -296,6 +311,7 @@ class StudentFeePayment(models.TransientModel):
 
                 invoice_lines.append((0, 0, {
                     'product_id': self.fee_type_id.product_id.id,
+                    'silina_installment_id': installment.id,
                     'name': f"{self.fee_type_id.name} - {installment.name}\nÉlève: {self.student_id.name}\nMatricule: {self.student_id.registration_number}\nClasse: {self.student_id.classroom_id.name if self.student_id.classroom_id else 'N/A'}",
                     'quantity': 1,
                     'price_unit': installment.amount,
@@ -316,6 +332,9 @@ class StudentFeePayment(models.TransientModel):
             'invoice_date': fields.Date.today(),
             'invoice_date_due': first_due_date or fields.Date.today(),
             'invoice_origin': f"{self.fee_type_id.name} - Année scolaire {self.student_id.academic_year_id.name}",
+            'silina_student_id': self.student_id.id,
+            'silina_fee_type_id': self.fee_type_id.id,
+            'silina_academic_year_id': self.student_id.academic_year_id.id,
             'invoice_line_ids': invoice_lines,
         }
 
@@ -0,0 +1,485 @@
+import base64
+import csv
+import io
+import logging
+import re
+import unicodedata
+from datetime import date, datetime
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+# Colonnes reconnues : clé interne -> en-têtes acceptés (sans accents, en minuscules)
+_IMPORT_COLUMNS = {
+    'last_name': ('last_name', 'nom'),
+    'first_name': ('first_name', 'prenom', 'prenoms'),
+    'name': ('name', 'nom complet'),
+    'registration_number': ('registration_number', 'matricule'),
+    'gender': ('gender', 'sexe'),
+    'date_of_birth': ('date_of_birth', 'date de naissance'),
+    'place_of_birth': ('place_of_birth', 'lieu de naissance'),
+    'level': ('level', 'niveau'),
+    'classroom': ('classroom', 'classe'),
+    'enrollment_date': ('enrollment_date', "date d'inscription"),
+    'email': ('email',),
+    'phone': ('phone', 'telephone'),
+    'mobile': ('mobile',),
+    'street': ('street', 'rue', 'adresse'),
+    'city': ('city', 'ville'),
+    'parent_name': ('parent_name', 'parent', 'nom du parent'),
+    'parent_relation': ('parent_relation', 'relation', 'lien de parente'),
+    'parent_phone': ('parent_phone', 'telephone du parent'),
+    'parent_email': ('parent_email', 'email du parent'),
+    'parent_financial': ('parent_financial', 'responsable financier'),
+}
+
+_GENDERS = {
+    'm': 'male', 'male': 'male', 'masculin': 'male', 'garcon': 'male', 'h': 'male', 'homme': 'male',
+    'f': 'female', 'female': 'female', 'feminin': 'female', 'fille': 'female', 'femme': 'female',
+}
+
+_RELATIONS = {
+    'father': 'father', 'pere': 'father',
+    'mother': 'mother', 'mere': 'mother',
+    'guardian': 'guardian', 'tuteur': 'guardian', 'tutrice': 'guardian',
+}
+
+_TRUE_VALUES = ('1', 'x', 'oui', 'o', 'yes', 'y', 'true', 'vrai')
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y')
+
+
+def _normalize_key(value):
+    """Minuscules, sans accents ni espaces superflus (en-têtes et clés de recherche)"""
+    value = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(value.lower().replace('’', "'").split())
+
+
+def _normalize_phone(value):
+    return re.sub(r'\D', '', str(value or ''))
+
+
+class StudentImport(models.TransientModel):
+    """Import en masse des inscriptions à partir d'un fichier CSV ou XLSX
+
+    Le fichier est lu ligne à ligne et traité par lots : les classes, niveaux,
+    parents et matricules existants sont chargés une seule fois dans des
+    dictionnaires, puis chaque lot crée ses parents, contacts et élèves en
+    quelques ``create(vals_list)``. Une ligne invalide est signalée sans
+    interrompre l'import ; un lot en échec est rejoué ligne par ligne.
+    """
+    _name = 'silina.student.import.wizard'
+    _description = 'Assistant d\'Import des Inscriptions'
+
+    # Nombre de lignes traitées par lot
+    _import_batch_size = 500
+
+    file = fields.Binary(
+        string='Fichier',
+        required=True,
+        help="Fichier CSV (séparateur virgule ou point-virgule) ou XLSX, avec une ligne d'en-têtes"
+    )
+    filename = fields.Char(string='Nom du fichier')
+
+    academic_year_id = fields.Many2one(
+        'silina.academic.year',
+        string='Année Scolaire',
+        required=True,
+        default=lambda self: self.env['silina.academic.year'].get_current_year()
+    )
+
+    create_partners = fields.Boolean(
+        string='Créer les contacts de facturation',
+        default=True,
+        help="Créer immédiatement les contacts res.partner des élèves et des parents responsables financiers. "
+             "Sinon, les contacts des élèves sont créés à la première facture."
+    )
+
+    state = fields.Selection([
+        ('draft', 'Configuration'),
+        ('done', 'Terminé'),
+    ], string='État', default='draft')
+
+    imported_count = fields.Integer(string='Élèves importés', readonly=True)
+    parent_count = fields.Integer(string='Parents créés', readonly=True)
+    error_count = fields.Integer(string='Lignes en erreur', readonly=True)
+    error_log = fields.Text(string='Erreurs', readonly=True)
+
+    def action_import(self):
+        """Importer le fichier par lots"""
+        self.ensure_one()
+        if not self.file:
+            raise ValidationError(_('Veuillez sélectionner un fichier à importer!'))
+
+        lookups = self._prepare_lookups()
+        imported_count = parent_count = 0
+        errors = []
+
+        for chunk in split_every(self._import_batch_size, self._iter_rows()):
+            created, parents, chunk_errors = self._import_chunk(chunk, lookups)
+            imported_count += created
+            parent_count += parents
+            errors += chunk_errors
+
+        self.write({
+            'state': 'done',
+            'imported_count': imported_count,
+            'parent_count': parent_count,
+            'error_count': len(errors),
+            'error_log': '\n'.join(errors),
+        })
+        return {
+            'name': _('Import des Inscriptions'),
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    # ------------------------------------------------------------------
+    # Lecture du fichier
+    # ------------------------------------------------------------------
+
+    def _iter_rows(self):
+        """Parcourir les lignes du fichier
+
+        :return: générateur de tuples (numéro de ligne, dict {colonne: valeur})
+        """
+        content = base64.b64decode(self.file)
+        filename = (self.filename or '').lower()
+        if filename.endswith('.xlsx'):
+            rows = self._iter_xlsx(content)
+        elif filename.endswith('.csv') or not filename:
+            rows = self._iter_csv(content)
+        else:
+            raise UserError(_('Format de fichier non pris en charge: %s (CSV ou XLSX attendu)') % self.filename)
+
+        header = next(rows, None)
+        if not header:
+            raise UserError(_('Le fichier est vide!'))
+        columns = self._map_header(header)
+
+        for row_number, row in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in row):
+                continue
+            yield row_number, {
+                key: row[index] if index < len(row) else None
+                for key, index in columns.items()
+            }
+
+    def _iter_csv(self, content):
+        try:
+            text = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = content.decode('latin-1')
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(io.StringIO(text), dialect)
+
+    def _iter_xlsx(self, content):
+        if openpyxl is None:
+            raise UserError(_('La bibliothèque Python "openpyxl" est requise pour importer des fichiers XLSX.'))
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    @api.model
+    def _map_header(self, header):
+        """Associer chaque colonne reconnue à sa position dans le fichier"""
+        aliases = {alias: key for key, names in _IMPORT_COLUMNS.items() for alias in names}
+        columns = {}
+        for index, label in enumerate(header):
+            key = aliases.get(_normalize_key(label))
+            if key and key not in columns:
+                columns[key] = index
+        if not ({'last_name', 'first_name'} <= columns.keys() or 'name' in columns):
+            raise UserError(_('Colonnes obligatoires manquantes: "Nom" et "Prénom" (ou "Nom complet").'))
+        for key in ('gender', 'date_of_birth'):
+            if key not in columns:
+                raise UserError(_('Colonne obligatoire manquante: %s') % _IMPORT_COLUMNS[key][1].capitalize())
+        return columns
+
+    # ------------------------------------------------------------------
+    # Dictionnaires de correspondance
+    # ------------------------------------------------------------------
+
+    def _prepare_lookups(self):
+        """Charger en une requête par modèle les données de correspondance
+
+        :return: dict des dictionnaires de correspondance
+        """
+        self.ensure_one()
+        classrooms = {}
+        classrooms_by_level = {}
+        for classroom in self.env['silina.classroom'].search_read(
+                [('academic_year_id', '=', self.academic_year_id.id)], ['name', 'code', 'level_id']):
+            level_key = _normalize_key(classroom['level_id'][1]) if classroom['level_id'] else ''
+            for label in (classroom['code'], classroom['name']):
+                if label:
+                    classrooms.setdefault(_normalize_key(label), classroom['id'])
+                    classrooms_by_level.setdefault((level_key, _normalize_key(label)), classroom['id'])
+
+        parents = {}
+        for parent in self.env['silina.parent'].search_read([], ['phone', 'mobile', 'email']):
+            for phone in (parent['phone'], parent['mobile']):
+                if _normalize_phone(phone):
+                    parents.setdefault(('phone', _normalize_phone(phone)), parent['id'])
+            if parent['email']:
+                parents.setdefault(('email', parent['email'].strip().lower()), parent['id'])
+
+        registration_numbers = {
+            number for number, in self.env['silina.student'].with_context(active_test=False)._read_group(
+                [('academic_year_id', '=', self.academic_year_id.id)], ['registration_number'])
+        }
+
+        return {
+            'classrooms': classrooms,
+            'classrooms_by_level': classrooms_by_level,
+            'parents': parents,
+            'registration_numbers': registration_numbers,
+        }
+
+    # ------------------------------------------------------------------
+    # Traitement d'un lot
+    # ------------------------------------------------------------------
+
+    def _import_chunk(self, chunk, lookups):
+        """Importer un lot de lignes dans un savepoint, ou ligne par ligne en cas d'échec
+
+        :return: tuple (élèves créés, parents créés, liste des erreurs)
+        """
+        rows, errors = [], []
+        chunk_numbers = set()
+        for row_number, row in chunk:
+            try:
+                values = self._prepare_row(row, lookups)
+                number = values[0].get('registration_number')
+                if number in chunk_numbers:
+                    raise ValidationError(_('Matricule %s en double dans le fichier') % number)
+                if number:
+                    chunk_numbers.add(number)
+                rows.append((row_number, values))
+            except ValidationError as e:
+                errors.append(_('Ligne %(row)s: %(error)s') % {'row': row_number, 'error': e.args[0]})
+
+        try:
+            with self.env.cr.savepoint():
+                created, parents = self._create_rows(rows, lookups)
+        except Exception as batch_error:
+            _logger.warning("Import des inscriptions: lot en échec (%s), reprise ligne par ligne", batch_error)
+            created = parents = 0
+            for row_number, values in rows:
+                try:
+                    with self.env.cr.savepoint():
+                        row_created, row_parents = self._create_rows([(row_number, values)], lookups)
+                    created += row_created
+                    parents += row_parents
+                except Exception as e:
+                    errors.append(_('Ligne %(row)s: %(error)s') % {'row': row_number, 'error': str(e)})
+        return created, parents, errors
+
+    def _prepare_row(self, row, lookups):
+        """Valider et normaliser une ligne
+
+        :return: tuple (valeurs de l'élève, clés du parent, valeurs du parent)
+        :raise ValidationError: si la ligne est invalide
+        """
+        student_vals = self.env['silina.student']._format_name_vals({
+            'last_name': self._cell_text(row.get('last_name')),
+            'first_name': self._cell_text(row.get('first_name')),
+            'name': self._cell_text(row.get('name')),
+        })
+        if not (student_vals.get('last_name') and student_vals.get('first_name')):
+            raise ValidationError(_('Nom et prénom obligatoires'))
+
+        gender = _GENDERS.get(_normalize_key(row.get('gender')))
+        if not gender:
+            raise ValidationError(_('Sexe invalide: %s') % (row.get('gender') or ''))
+
+        date_of_birth = self._cell_date(row.get('date_of_birth'))
+        if not date_of_birth:
+            raise ValidationError(_('Date de naissance invalide: %s') % (row.get('date_of_birth') or ''))
+
+        student_vals.update({
+            'gender': gender,
+            'date_of_birth': date_of_birth,
+            'academic_year_id': self.academic_year_id.id,
+            'place_of_birth': self._cell_text(row.get('place_of_birth')),
+            'email': self._cell_text(row.get('email')),
+            'phone': self._cell_text(row.get('phone')),
+            'mobile': self._cell_text(row.get('mobile')),
+            'street': self._cell_text(row.get('street')),
+            'city': self._cell_text(row.get('city')),
+        })
+
+        enrollment_date = self._cell_date(row.get('enrollment_date'))
+        if enrollment_date:
+            student_vals['enrollment_date'] = enrollment_date
+
+        registration_number = self._cell_text(row.get('registration_number'))
+        if registration_number:
+            if registration_number in lookups['registration_numbers']:
+                raise ValidationError(_('Le matricule %s existe déjà pour cette année scolaire') % registration_number)
+            student_vals['registration_number'] = registration_number
+
+        classroom_label = _normalize_key(row.get('classroom'))
+        if classroom_label:
+            level_label = _normalize_key(row.get('level'))
+            classroom_id = lookups['classrooms_by_level'].get((level_label, classroom_label)) if level_label \
+                else lookups['classrooms'].get(classroom_label)
+            if not classroom_id:
+                raise ValidationError(_('Classe introuvable pour cette année scolaire: %s') % row.get('classroom'))
+            student_vals.update({'classroom_id': classroom_id, 'state': 'enrolled'})
+
+        parent_keys, parent_vals = self._prepare_parent(row, lookups)
+        return student_vals, parent_keys, parent_vals
+
+    def _prepare_parent(self, row, lookups):
+        """Identifier le parent de la ligne (téléphone, puis email, puis nom)
+
+        Le nom n'identifie le parent que si la ligne n'a ni téléphone ni
+        email. Toutes les clés de la ligne sont retournées : le parent trouvé
+        ou créé est ensuite retrouvé par chacune d'elles aux lignes suivantes.
+
+        :return: tuple (clés du parent, valeurs pour le créer s'il n'existe pas)
+        """
+        name = self._cell_text(row.get('parent_name'))
+        phone = self._cell_text(row.get('parent_phone'))
+        email = self._cell_text(row.get('parent_email'))
+        if not (name or phone or email):
+            return False, False
+
+        keys = []
+        if _normalize_phone(phone):
+            keys.append(('phone', _normalize_phone(phone)))
+        if email:
+            keys.append(('email', email.lower()))
+        if not keys and name:
+            keys.append(('name', _normalize_key(name)))
+        for key in keys:
+            if key in lookups['parents']:
+                return tuple(keys), False
+
+        if not name:
+            raise ValidationError(_('Nom du parent obligatoire pour créer un nouveau parent'))
+        parent_vals = {
+            'name': name,
+            'relation': _RELATIONS.get(_normalize_key(row.get('parent_relation')), 'other'),
+            'phone': phone,
+            'email': email,
+            'is_financial_responsible': _normalize_key(row.get('parent_financial')) in _TRUE_VALUES,
+        }
+        return tuple(keys), parent_vals
+
+    def _create_rows(self, rows, lookups):
+        """Créer les parents, contacts et élèves d'un lot de lignes validées
+
+        :return: tuple (élèves créés, parents créés)
+        """
+        if not rows:
+            return 0, 0
+        create_context = {
+            'tracking_disable': True,
+            'mail_create_nolog': True,
+            'mail_create_nosubscribe': True,
+        }
+
+        # Nouveaux parents du lot (une seule fois chacun, même s'ils ont plusieurs
+        # enfants ou si les lignes les désignent par des clés différentes)
+        new_parents = {}
+        primary_keys = {}
+        for row_number, (student_vals, parent_keys, parent_vals) in rows:
+            if parent_vals and not any(key in lookups['parents'] for key in parent_keys):
+                primary_key = next((primary_keys[key] for key in parent_keys if key in primary_keys), parent_keys[0])
+                new_parents.setdefault(primary_key, parent_vals)
+                for key in parent_keys:
+                    primary_keys.setdefault(key, primary_key)
+
+        parent_ids = {}
+        parents = self.env['silina.parent']
+        if new_parents:
+            parent_vals_list = list(new_parents.values())
+            if self.create_partners:
+                self._attach_parent_partners(parent_vals_list)
+            parents = parents.with_context(**create_context).create(parent_vals_list)
+            created_ids = dict(zip(new_parents, parents.ids))
+            parent_ids = {key: created_ids[primary_key] for key, primary_key in primary_keys.items()}
+
+        student_vals_list = []
+        for row_number, (student_vals, parent_keys, parent_vals) in rows:
+            vals = dict(student_vals)
+            if parent_keys:
+                parent_id = next(
+                    (lookups['parents'][key] for key in parent_keys if key in lookups['parents']),
+                    None,
+                ) or parent_ids[parent_keys[0]]
+                vals['parent_ids'] = [(6, 0, [parent_id])]
+                # Parent retrouvé ou créé : l'enregistrer sous toutes les clés de la ligne
+                for key in parent_keys:
+                    parent_ids.setdefault(key, parent_id)
+            student_vals_list.append(vals)
+
+        students = self.env['silina.student'].with_context(
+            defer_student_partner=True, **create_context
+        ).create(student_vals_list)
+        if self.create_partners:
+            students._create_partners()
+
+        # Le lot est validé : les lignes suivantes réutilisent ses parents et matricules
+        for key, parent_id in parent_ids.items():
+            lookups['parents'].setdefault(key, parent_id)
+        lookups['registration_numbers'].update(students.mapped('registration_number'))
+        return len(students), len(parents)
+
+    def _attach_parent_partners(self, parent_vals_list):
+        """Créer en une fois les contacts des nouveaux parents responsables financiers"""
+        financial_vals = [vals for vals in parent_vals_list if vals['is_financial_responsible']]
+        if not financial_vals:
+            return
+        partners = self.env['res.partner'].sudo().create([{
+            'name': vals['name'],
+            'email': vals['email'],
+            'phone': vals['phone'],
+            'comment': f"Parent/Tuteur - {vals['relation']}",
+            'customer_rank': 1,
+        } for vals in financial_vals])
+        for vals, partner in zip(financial_vals, partners):
+            vals['partner_id'] = partner.id
+
+    @api.model
+    def _cell_text(self, value):
+        if value is None:
+            return False
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip() or False
+
+    @api.model
+    def _cell_date(self, value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        value = self._cell_text(value)
+        if not value:
+            return False
+        for date_format in _DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return False